@@ -1,10 +1,16 @@
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.schema import AsyncQuery as CRMAsyncQuery, Query as CRMQuery, Mutation as CRMMutation
 
 class Query(CRMQuery, graphene.ObjectType):
     pass
 
+class AsyncQuery(CRMAsyncQuery, graphene.ObjectType):
+    pass
+
 class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
 schema = graphene.Schema(query=Query, mutation=Mutation)
+
+# Served by AsyncCRMGraphQLView under ASGI.
+async_schema = graphene.Schema(query=AsyncQuery, mutation=Mutation)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import databases_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -82,12 +85,13 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Configured by environment variables, see alx_backend_graphql_crm/database.py.
+# Without DATABASE_URL this is the SQLite file next to manage.py.
+DATABASES = databases_from_env(os.environ, f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+
+# GraphQL queries read from a replica when DATABASE_REPLICA_URLS lists any;
+# mutations and everything outside the GraphQL view use the primary.
+DATABASE_ROUTERS = ['crm.routers.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -126,11 +130,72 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded import files (crm.imports) are kept here until their job finishes.
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Largest upload /imports/customers accepts, in bytes; larger ones get a 413.
+CUSTOMER_IMPORT = {
+    'MAX_UPLOAD_SIZE': 100 * 1024 * 1024,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# Switch to 'django.core.cache.backends.redis.RedisCache' with
+# LOCATION 'redis://localhost:6379/1' to share entries between processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Opt-in cache of GraphQL query responses, evicted by model signals.
+GRAPHQL_RESPONSE_CACHE = {
+    'ENABLED': False,
+    'TIMEOUT': 60,
+    # Seconds after a write during which replica reads of it are not cached.
+    'REPLICA_LAG': 5,
+}
+
+# Seconds an automatic persisted query stays registered.
+GRAPHQL_PERSISTED_QUERIES = {
+    'TIMEOUT': 24 * 60 * 60,
+}
+
+# Send the header with value 1 (DEBUG or staff users only) to get a
+# per-field timing and SQL breakdown in extensions.profile. LOG profiles
+# a SAMPLE_RATE fraction of operations and logs them as structured data to
+# the "crm.profile" logger. Profiled operations bypass the response cache,
+# run synchronously on the async view and read from the primary, so keep
+# the rate low in production.
+GRAPHQL_PROFILE = {
+    'HEADER': 'X-GraphQL-Profile',
+    'LOG': False,
+    'SAMPLE_RATE': 0.01,
+}
+
+# Client used by the cron jobs and scripts (crm.graphql_client). The schema
+# introspection is cached in SCHEMA_FILE until the schema changes. With
+# IN_PROCESS the jobs call schema.execute directly instead of going over HTTP.
+GRAPHQL_CLIENT = {
+    'ENDPOINT': 'http://localhost:8000/graphql',
+    'IN_PROCESS': False,
+    'SCHEMA_FILE': '/tmp/crm_graphql_schema.json',
+    'TIMEOUT': 15,
+}
+
+# Budget for crm.complexity: every field costs 1, multiplied by the page
+# size of enclosing connections (LIST_SIZE for nested relations and lists).
+GRAPHQL_QUERY_COST = {
+    'MAX_COST': 50000,
+    'MAX_DEPTH': 12,
+    'LIST_SIZE': 10,
+}
+
 # django-crontab settings
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
@@ -154,5 +219,13 @@ CELERY_BEAT_SCHEDULE = {
         "task": "crm.tasks.generate_crm_report",
         "schedule": crontab(day_of_week="mon", hour=6, minute=0),
     },
+    "refresh-daily-stats": {
+        "task": "crm.tasks.refresh_daily_stats",
+        "schedule": crontab(minute="*/10"),
+    },
+    "rebuild-recent-daily-stats": {
+        "task": "crm.tasks.rebuild_recent_daily_stats",
+        "schedule": crontab(hour=1, minute=30),
+    },
 }
 
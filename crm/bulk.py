@@ -0,0 +1,97 @@
+from itertools import islice
+
+from phonenumber_field.phonenumber import to_python
+
+from .models import Customer
+
+BATCH_SIZE = 1000
+
+
+def chunked(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def existing_values(queryset, field, values):
+    """
+    Returns the subset of ``values`` already stored in ``field``, looked up
+    with one ``__in`` query per chunk to stay under backend parameter limits.
+    """
+    found = set()
+    for chunk in chunked(set(values)):
+        found.update(queryset.filter(**{f"{field}__in": chunk}).values_list(field, flat=True))
+    return found
+
+
+def parse_phone_numbers(raw_numbers):
+    """
+    Parses each distinct phone string once and maps it to a
+    ``(phone_number, error_message)`` pair.
+    """
+    parsed = {}
+    for raw in set(raw_numbers):
+        try:
+            phone_number = to_python(raw)
+        except Exception:
+            parsed[raw] = (None, "Invalid phone number format.")
+            continue
+        if not phone_number.is_valid():
+            parsed[raw] = (None, "Invalid phone number.")
+        else:
+            parsed[raw] = (phone_number, None)
+    return parsed
+
+
+CUSTOMER_FIELDS = ("name", "email", "phone")
+
+
+def non_string_field(row):
+    """The first customer field of ``row`` holding something other than text, as NDJSON rows may."""
+    return next((field for field in CUSTOMER_FIELDS if row.get(field) is not None and not isinstance(row[field], str)), None)
+
+
+def build_customers(rows, offset=0):
+    """
+    Validates customer rows (dicts with ``name``, ``email`` and an optional
+    ``phone``, or None for a row that could not be parsed) and returns the
+    unsaved customers with a ``{index, field, message}`` error for every
+    rejected row, indexed from ``offset``.
+    """
+    errors = []
+    valid_rows = [row for row in rows if row is not None and non_string_field(row) is None]
+    existing_emails = existing_values(Customer.objects, "email", (row.get("email") for row in valid_rows if row.get("email")))
+    phone_numbers = parse_phone_numbers(row.get("phone") for row in valid_rows if row.get("phone"))
+
+    customers = []
+    for i, row in enumerate(rows, offset):
+        if row is None:
+            errors.append({"index": i, "field": None, "message": "Invalid row."})
+            continue
+        field = non_string_field(row)
+        if field:
+            errors.append({"index": i, "field": field, "message": f"{field.capitalize()} must be a string."})
+            continue
+        name, email, phone = row.get("name"), row.get("email"), row.get("phone")
+        missing = next((field for field, value in (("name", name), ("email", email)) if not value), None)
+        if missing:
+            errors.append({"index": i, "field": missing, "message": f"{missing.capitalize()} is required."})
+            continue
+        # Emails seen earlier in the batch count as existing, as they did row by row.
+        if email in existing_emails:
+            errors.append({"index": i, "field": "email", "message": f"Email {email} already exists."})
+            continue
+
+        phone_number = None
+        if phone:
+            phone_number, message = phone_numbers[phone]
+            if message:
+                errors.append({"index": i, "field": "phone", "message": message})
+                continue
+
+        customer = Customer(name=name, email=email)
+        if phone_number:
+            customer.phone = phone_number
+        existing_emails.add(email)
+        customers.append(customer)
+    return customers, errors
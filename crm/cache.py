@@ -0,0 +1,170 @@
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, is_abstract_type, print_ast, visit
+
+VERSION_PREFIX = "crm:cache-version:"
+RESPONSE_PREFIX = "crm:response:"
+WRITTEN_PREFIX = "crm:cache-written:"
+
+
+def bump_versions(*models):
+    lag = response_cache.options.get("REPLICA_LAG", 5)
+    if lag:
+        # Marked before the versions move, so a reader that sees the new
+        # versions also sees the marks.
+        cache.set_many({WRITTEN_PREFIX + model._meta.label_lower: True for model in models}, lag)
+    for model in models:
+        key = VERSION_PREFIX + model._meta.label_lower
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+
+
+def invalidate(*models):
+    """
+    Evicts cached responses that read any of ``models`` once the current
+    transaction commits, so readers never cache the pre-commit state.
+    """
+    transaction.on_commit(partial(bump_versions, *models))
+
+
+class DocumentCache:
+    """
+    Thread-safe LRU keyed by operation hash, used for parsed documents and
+    per-operation metadata.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._documents.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._documents[key] = entry
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+
+class ModelCollector(Visitor):
+    def __init__(self, schema, type_info):
+        super().__init__()
+        self.schema = schema
+        self.type_info = type_info
+        self.models = set()
+
+    def enter_field(self, node, *args):
+        named_type = get_named_type(self.type_info.get_type())
+        if is_abstract_type(named_type):
+            # node/nodes may return any type implementing Node.
+            for possible_type in self.schema.get_possible_types(named_type):
+                self.add_type(possible_type)
+        else:
+            self.add_type(named_type)
+
+    def add_type(self, graphql_type):
+        graphene_type = getattr(graphql_type, "graphene_type", None)
+        # Plain ObjectTypes built from models list them in ``cache_models``.
+        self.models.update(model._meta.label_lower for model in getattr(graphene_type, "cache_models", ()))
+        meta = getattr(graphene_type, "_meta", None)
+        # Connections read their node's table even when only totalCount is selected.
+        node_type = getattr(meta, "node", None)
+        if node_type is not None:
+            meta = node_type._meta
+        model = getattr(meta, "model", None)
+        if model is not None:
+            self.models.add(model._meta.label_lower)
+
+
+class ResponseCache:
+    """
+    Opt-in cache of query results keyed by the normalized operation, its
+    variables and the versions of every model the operation reads.
+    Enabled through ``GRAPHQL_RESPONSE_CACHE = {"ENABLED": True, "TIMEOUT": 60}``.
+    ``REPLICA_LAG`` is how many seconds after a write replica reads of the
+    written models are not stored (default 5, at least the replicas' lag).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._operations = DocumentCache(getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 512))
+
+    @property
+    def options(self):
+        return getattr(settings, "GRAPHQL_RESPONSE_CACHE", {})
+
+    @property
+    def enabled(self):
+        return self.options.get("ENABLED", False)
+
+    def operation(self, document_key, schema, document):
+        """
+        Returns the normalized operation hash and the models it reads,
+        computed once per document.
+        """
+        operation = self._operations.get(document_key)
+        if operation is None:
+            # print_ast normalizes whitespace and formatting between equivalent queries.
+            normalized = hashlib.sha256(print_ast(document).encode()).hexdigest()
+            type_info = TypeInfo(schema)
+            collector = ModelCollector(schema, type_info)
+            visit(document, TypeInfoVisitor(type_info, collector))
+            operation = (normalized, sorted(collector.models))
+            self._operations.set(document_key, operation)
+        return operation
+
+    def key(self, document_key, schema, document, variables, operation_name):
+        operation_key, models = self.operation(document_key, schema, document)
+        versions = cache.get_many([VERSION_PREFIX + model for model in models])
+        payload = [operation_key, variables or {}, operation_name, [versions.get(VERSION_PREFIX + m, 0) for m in models]]
+        return RESPONSE_PREFIX + hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def recently_written(self, document_key, schema, document):
+        """
+        Whether a model the operation reads was written in the last
+        ``REPLICA_LAG`` seconds. A replica may not have applied that write
+        yet, though the versions in the key already include it.
+        """
+        _, models = self.operation(document_key, schema, document)
+        return bool(cache.get_many([WRITTEN_PREFIX + model for model in models]))
+
+    def get(self, key):
+        data = cache.get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        cache.set(key, data, self.options.get("TIMEOUT", 60))
+
+
+response_cache = ResponseCache()
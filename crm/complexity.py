@@ -0,0 +1,121 @@
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLInt,
+    InlineFragmentNode,
+    Undefined,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    is_list_type,
+    value_from_ast,
+)
+
+DEFAULT_QUERY_COST = {
+    "MAX_COST": 50000,
+    "MAX_DEPTH": 12,
+    # Assumed size of plain list fields such as Order.lines, which are not paginated.
+    "LIST_SIZE": 10,
+}
+
+
+def query_cost_options():
+    return {**DEFAULT_QUERY_COST, **getattr(settings, "GRAPHQL_QUERY_COST", {})}
+
+
+def is_connection(graphql_type):
+    meta = getattr(getattr(graphql_type, "graphene_type", None), "_meta", None)
+    return getattr(meta, "node", None) is not None
+
+
+class QueryCost:
+    """
+    Estimates the cost of an operation before it runs. Every field costs one,
+    and the fields below a list are multiplied by its expected length: the
+    ``first``/``last`` argument of the enclosing connection, or otherwise the
+    relay maximum for top-level connections and ``LIST_SIZE`` for nested
+    connections and plain lists, which are bounded by their relation.
+    """
+
+    def __init__(self, context, variables, options):
+        self.context = context
+        self.variables = variables or {}
+        self.options = options
+
+    def page_size(self, node, default):
+        for argument in node.arguments:
+            if argument.name.value in ("first", "last"):
+                value = value_from_ast(argument.value, GraphQLInt, self.variables)
+                if value is not Undefined and value is not None:
+                    # A negative size is an error at execution, but must not lower the estimate.
+                    return max(0, value)
+        return default
+
+    def fields(self, selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection
+            elif isinstance(selection, InlineFragmentNode):
+                yield from self.fields(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.context.get_fragment(selection.name.value)
+                if fragment is not None:
+                    yield from self.fields(fragment.selection_set)
+
+    def measure(self, parent_type, selection_set, page_size=None, nested=False):
+        """Returns ``(cost, depth)`` for ``selection_set`` under ``parent_type``."""
+        cost = depth = 0
+        for node in self.fields(selection_set):
+            field = getattr(parent_type, "fields", {}).get(node.name.value)
+            if field is None:
+                # __typename and introspection fields are free.
+                continue
+            field_cost, field_depth = 1, 1
+            if node.selection_set is not None:
+                child_type = get_named_type(field.type)
+                multiplier = 1
+                child_page_size = None
+                if is_connection(child_type):
+                    child_page_size = self.page_size(
+                        node, self.options["LIST_SIZE"] if nested else graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+                    )
+                elif is_list_type(get_nullable_type(field.type)):
+                    multiplier = page_size or self.options["LIST_SIZE"]
+                child_cost, child_depth = self.measure(child_type, node.selection_set, child_page_size, True)
+                field_cost += multiplier * child_cost
+                field_depth += child_depth
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+
+def query_cost_rule(variables=None, on_cost=None):
+    """
+    Builds a validation rule that rejects operations whose estimated cost or
+    depth exceeds ``GRAPHQL_QUERY_COST``. Costs depend on the request's
+    variables, so the rule is built per request. ``on_cost`` receives
+    ``(operation_name, cost, depth)`` for every operation in the document.
+    """
+    options = query_cost_options()
+
+    class QueryCostRule(ValidationRule):
+        def enter_operation_definition(self, node, *args):
+            root_type = self.context.schema.get_root_type(node.operation)
+            cost, depth = QueryCost(self.context, variables, options).measure(root_type, node.selection_set)
+            name = node.name.value if node.name else None
+            if on_cost is not None:
+                on_cost(name, cost, depth)
+            label = f"'{name}'" if name else "anonymous operation"
+            if depth > options["MAX_DEPTH"]:
+                self.report_error(GraphQLError(
+                    f"{label} exceeds maximum operation depth of {options['MAX_DEPTH']}.", node,
+                ))
+            if cost > options["MAX_COST"]:
+                self.report_error(GraphQLError(
+                    f"{label} has an estimated cost of {cost}, above the maximum of {options['MAX_COST']}.", node,
+                ))
+
+    return QueryCostRule
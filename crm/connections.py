@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import json
+from functools import partial
+
+import graphene
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+
+from .loaders import get_loaders
+from .optimizer import optimize_queryset
+
+
+EXACT = "exact"
+APPROXIMATE = "approximate"
+APPROXIMATE_COUNT_TIMEOUT = 60
+
+
+def approximate_count(queryset):
+    """
+    Uses the planner's row estimate on PostgreSQL and a count cached for
+    APPROXIMATE_COUNT_TIMEOUT seconds on other backends.
+    """
+    if connections[queryset.db].vendor == "postgresql":
+        plan = json.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+    sql, params = queryset.query.sql_with_params()
+    key = "crm:count:" + hashlib.sha256(repr((queryset.db, sql, params)).encode()).hexdigest()
+    return cache.get_or_set(key, queryset.count, APPROXIMATE_COUNT_TIMEOUT)
+
+
+class CRMConnection(graphene.relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int(description="Number of matching rows; estimated on approximate-count connections.")
+
+    def resolve_total_count(root, info):
+        # Only computed when selected; list-backed connections already know their length.
+        if getattr(root, "length", None) is not None:
+            return root.length
+        if getattr(root, "count_mode", EXACT) == APPROXIMATE:
+            return approximate_count(root.iterable)
+        return root.iterable.count()
+
+    def resolve_edges(root, info):
+        # Queue the page's relation keys before any node field is resolved.
+        get_loaders(info).prime(edge.node for edge in root.edges)
+        return root.edges
+
+
+class CRMConnectionField(DjangoFilterConnectionField):
+    """
+    Filter connection field whose queryset only loads the columns and
+    relations requested by the query.
+    """
+
+    required_fields = ()
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class, required_fields=()):
+        queryset = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        return optimize_queryset(queryset, info, required_fields)
+
+    def get_queryset_resolver(self):
+        return partial(super().get_queryset_resolver(), required_fields=self.required_fields)
+
+
+class KeysetConnectionField(CRMConnectionField):
+    """
+    Drop-in replacement for CRMConnectionField that paginates with
+    ``WHERE (keyset) > (cursor) ORDER BY keyset LIMIT n`` instead of OFFSET,
+    so every page costs the same regardless of depth. Cursors encode the
+    keyset values of the edge; the last keyset field must be unique.
+    No COUNT(*) runs unless ``totalCount`` is selected, and ``count_mode``
+    chooses between an exact and an approximate count for it.
+    """
+
+    def __init__(self, type_, *args, keyset=("id",), count_mode=EXACT, **kwargs):
+        super().__init__(type_, *args, **kwargs)
+        self._base_args.pop("offset", None)
+        self.keyset = tuple(keyset)
+        self.required_fields = self.keyset
+        self.count_mode = count_mode
+
+    def encode_cursor(self, node):
+        values = [getattr(node, name) for name in self.keyset]
+        # isoformat keeps microseconds, which DjangoJSONEncoder would truncate.
+        encoded = json.dumps(values, default=lambda v: v.isoformat() if hasattr(v, "isoformat") else str(v))
+        return base64.urlsafe_b64encode(encoded.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.keyset):
+                raise ValueError(cursor)
+            return [self.model._meta.get_field(name).to_python(value) for name, value in zip(self.keyset, values)]
+        except Exception:
+            raise GraphQLError(f"Invalid cursor for `{self.model.__name__}` connection.")
+
+    def keyset_filter(self, cursor, lookup):
+        # Expands (a, b) > (x, y) into a >= x AND (a > x OR (a = x AND b > y));
+        # the leading a >= x lets the planner use a range scan on a's index.
+        values = self.decode_cursor(cursor)
+        condition = Q()
+        for i, name in enumerate(self.keyset):
+            equal = {field: value for field, value in zip(self.keyset[:i], values[:i])}
+            condition |= Q(**equal, **{f"{name}__{lookup}": values[i]})
+        if len(self.keyset) > 1:
+            condition &= Q(**{f"{self.keyset[0]}__{lookup}e": values[0]})
+        return condition
+
+    def connection_resolver(self, resolver, connection, default_manager, queryset_resolver, max_limit,
+                            enforce_first_or_last, root, info, **args):
+        first, last = args.get("first"), args.get("last")
+        if enforce_first_or_last and not (first or last):
+            raise GraphQLError(f"You must provide a `first` or `last` value to paginate the `{info.field_name}` connection.")
+        for count in (first, last):
+            if max_limit and count and count > max_limit:
+                raise GraphQLError(
+                    f"Requesting {count} records on the `{info.field_name}` connection exceeds the limit of {max_limit} records."
+                )
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+        return self.resolve_keyset_connection(connection, queryset, args, max_limit)
+
+    def resolve_keyset_connection(self, connection, queryset, args, max_limit):
+        after, before = args.get("after"), args.get("before")
+        first, last = args.get("first"), args.get("last")
+        filtered = queryset
+        if after:
+            queryset = queryset.filter(self.keyset_filter(after, "gt"))
+        if before:
+            queryset = queryset.filter(self.keyset_filter(before, "lt"))
+
+        backwards = last is not None and first is None
+        limit = (last if backwards else first) or max_limit or graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        ordering = [f"-{name}" if backwards else name for name in self.keyset]
+        nodes = list(queryset.order_by(*ordering)[:limit + 1])
+        has_more = len(nodes) > limit
+        nodes = nodes[:limit]
+        if backwards:
+            nodes.reverse()
+
+        edges = [connection.Edge(node=node, cursor=self.encode_cursor(node)) for node in nodes]
+        page_info = graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            # Only the direction being paginated is checked; the other side is
+            # reported from the presence of a cursor, as the relay spec allows.
+            has_previous_page=has_more if backwards else bool(after),
+            has_next_page=bool(before) if backwards else has_more,
+        )
+        result = connection(edges=edges, page_info=page_info)
+        result.iterable = filtered.order_by()
+        result.count_mode = self.count_mode
+        return result
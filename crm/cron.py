@@ -1,9 +1,8 @@
 import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+from crm.graphql_client import get_client
 
 LOG_FILE = "/tmp/crm_heartbeat_log.txt"
-GQL_ENDPOINT = "http://localhost:8000/graphql"
 
 def log_crm_heartbeat():
     """
@@ -12,12 +11,10 @@ def log_crm_heartbeat():
     timestamp = datetime.datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
     message = f"{timestamp} CRM is alive"
 
-    # Optional: Check if the GraphQL endpoint is responsive
+    # Optional: Check if the GraphQL endpoint is responsive. Always over HTTP,
+    # running the query in-process would not tell whether the server is up.
     try:
-        transport = RequestsHTTPTransport(url=GQL_ENDPOINT, timeout=5)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        query = gql("{ allCustomers(first: 1) { edges { node { id } } } }")
-        client.execute(query)
+        get_client(in_process=False).execute("{ allCustomers(first: 1) { edges { node { id } } } }")
         message += " (GraphQL endpoint is responsive)"
 
     except Exception as e:
@@ -36,7 +33,7 @@ def update_low_stock():
     Executes a GraphQL mutation to restock low-stock products and logs the result.
     """
     log_file = "/tmp/low_stock_updates_log.txt"
-    mutation = gql('''
+    mutation = '''
         mutation {
             updateLowStockProducts {
                 updatedProducts {
@@ -46,12 +43,10 @@ def update_low_stock():
                 message
             }
         }
-    ''')
-    
+    '''
+
     try:
-        transport = RequestsHTTPTransport(url=GQL_ENDPOINT, timeout=15)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        result = client.execute(mutation)
+        result = get_client().execute(mutation)
         
         updated_products = result.get("updateLowStockProducts", {}).get("updatedProducts", [])
         
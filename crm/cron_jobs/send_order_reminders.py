@@ -1,12 +1,11 @@
 #!/usr/bin/env python
-import base64
+import argparse
+import json
 import os
 import sys
 from datetime import datetime, timedelta, timezone
 
 from dateutil.parser import parse
-from gql import Client, gql
-from gql.transport.requests import RequestsHTTPTransport
 
 # It's a good practice to have the project root on the python path
 # to ensure that Django settings are discoverable.
@@ -14,24 +13,23 @@ PROJECT_ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), '../..')
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 import django
 django.setup()
 
+from django.db.models import Q
+from graphql_relay import from_global_id
 
-# --- GraphQL Client Setup ---
-# The script assumes the Django development server is running at this address.
-GQL_ENDPOINT = "http://localhost:8000/graphql"
-transport = RequestsHTTPTransport(url=GQL_ENDPOINT)
-client = Client(transport=transport, fetch_schema_from_transport=False)
+from crm.graphql_client import get_client
+from crm.models import Order
 
-# --- GraphQL Query ---
-# Find all orders within the last 7 days.
-# The schema uses relay-style cursors (edges/node).
-GET_RECENT_ORDERS_QUERY = gql("""
-    query getRecentOrders($date: DateTime!) {
-      allOrders(orderDateGte: $date) {
+# Orders are paged oldest first, in the allOrders keyset order (orderDate, id),
+# so the last order of a run is the watermark for the next one.
+GET_RECENT_ORDERS_QUERY = """
+    query getRecentOrders($date: Date!, $first: Int!, $after: String) {
+      allOrders(orderDateGte: $date, first: $first, after: $after) {
         edges {
+          cursor
           node {
             id
             orderDate
@@ -40,59 +38,129 @@ GET_RECENT_ORDERS_QUERY = gql("""
             }
           }
         }
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
       }
     }
-""")
+"""
 
 LOG_FILE = "/tmp/order_reminders_log.txt"
+# Last order reminded of by a successful run.
+STATE_FILE = "/tmp/order_reminders_state.json"
 
-def fetch_and_log_reminders():
-    """
-    Fetches recent orders via GraphQL and logs reminders.
-    """
-    # Calculate the date 7 days ago from now (using timezone-aware datetime)
-    seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    
-    # Prepare variables for the query
-    params = {"date": seven_days_ago.isoformat()}
+REMINDER_WINDOW = timedelta(days=7)
+PAGE_SIZE = 100
+CHUNK_SIZE = 2000
+FLUSH_EVERY = 500
 
+
+def load_watermark(state_file=STATE_FILE):
     try:
-        # Execute the query
-        result = client.execute(GET_RECENT_ORDERS_QUERY, variable_values=params)
-        
-        orders = result.get("allOrders", {}).get("edges", [])
-        
-        if not orders:
+        with open(state_file) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    state["order_date"] = parse(state["order_date"])
+    return state
+
+
+def save_watermark(watermark, state_file=STATE_FILE):
+    # Written to a temporary file and renamed, so a crash never leaves half a state file.
+    tmp = f"{state_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({**watermark, "order_date": watermark["order_date"].isoformat()}, f)
+    os.replace(tmp, state_file)
+
+
+def is_after(order_date, order_id, watermark):
+    return watermark is None or (order_date, order_id) > (watermark["order_date"], watermark["id"])
+
+
+def graphql_orders(since, watermark):
+    """
+    Yields ``(order_id, order_date, email, cursor)`` one page at a time from
+    the allOrders connection, resuming from the last run's cursor.
+    """
+    client = get_client(in_process=False)
+    after = watermark and watermark.get("cursor")
+    while True:
+        result = client.execute(
+            GET_RECENT_ORDERS_QUERY, {"date": since.date().isoformat(), "first": PAGE_SIZE, "after": after}
+        )["allOrders"]
+        for edge in result["edges"]:
+            node = edge["node"]
+            _, order_id = from_global_id(node["id"])
+            order_date = parse(node["orderDate"])
+            # orderDateGte only filters by day, so skip what was already sent.
+            if is_after(order_date, int(order_id), watermark):
+                yield int(order_id), order_date, (node.get("customer") or {}).get("email", "no-email"), edge["cursor"]
+        if not result["pageInfo"]["hasNextPage"]:
             return
+        after = result["pageInfo"]["endCursor"]
 
-        with open(LOG_FILE, "a") as log:
-            timestamp = datetime.now().isoformat()
-            for order_edge in orders:
-                node = order_edge.get("node", {})
-                if not node:
-                    continue
-
-                # The 'id' from a relay spec is a base64 encoded string 'TypeName:ID'
-                # We decode it to get the actual database ID for logging.
-                try:
-                    _, order_id_str = base64.b64decode(node["id"]).decode("utf-8").split(":")
-                except (ValueError, TypeError):
-                    order_id_str = "invalid_id"
-
-                customer_email = node.get("customer", {}).get("email", "no-email")
-                
-                log.write(
-                    f"{timestamp}: Sending reminder for Order ID {order_id_str} "
-                    f"to customer {customer_email}.\n"
-                )
+
+def orm_orders(since, watermark):
+    """Yields the same tuples as ``graphql_orders`` straight from the database."""
+    orders = Order.objects.filter(order_date__gte=since)
+    if watermark is not None:
+        order_date, order_id = watermark["order_date"], watermark["id"]
+        orders = orders.filter(
+            Q(order_date__gte=order_date) & (Q(order_date__gt=order_date) | Q(order_date=order_date, pk__gt=order_id))
+        )
+    rows = orders.order_by("order_date", "pk").values_list("pk", "order_date", "customer__email")
+    for order_id, order_date, email in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield order_id, order_date, email, None
+
+
+def send_reminders(orders, log_file=LOG_FILE):
+    """
+    Logs a reminder for every order, writing lines in batches. Returns the
+    number of reminders and the watermark of the last order.
+    """
+    timestamp = datetime.now().isoformat()
+    count, last, buffer = 0, None, []
+    with open(log_file, "a") as log:
+        for order_id, order_date, email, cursor in orders:
+            buffer.append(f"{timestamp}: Sending reminder for Order ID {order_id} to customer {email}.\n")
+            count += 1
+            last = {"id": order_id, "order_date": order_date, "cursor": cursor}
+            if len(buffer) >= FLUSH_EVERY:
+                log.writelines(buffer)
+                buffer.clear()
+        log.writelines(buffer)
+    return count, last
+
+
+def fetch_and_log_reminders(in_process=False, log_file=LOG_FILE, state_file=STATE_FILE):
+    """
+    Logs reminders for orders placed in the last 7 days that no earlier
+    successful run has covered. Memory use does not grow with the number
+    of orders: they are streamed a page or a chunk at a time.
+    """
+    try:
+        watermark = load_watermark(state_file)
+        since = datetime.now(timezone.utc) - REMINDER_WINDOW
+        source = orm_orders if in_process else graphql_orders
+        count, last = send_reminders(source(since, watermark), log_file)
+        if last is not None:
+            save_watermark(last, state_file)
+        return count
 
     except Exception as e:
         # Log errors to stderr or a dedicated error log
         error_timestamp = datetime.now().isoformat()
-        with open(LOG_FILE, "a") as log:
+        with open(log_file, "a") as log:
             log.write(f"{error_timestamp}: ERROR: Failed to process order reminders: {e}\n")
         sys.stderr.write(f"Error: {e}\n")
 
+
 if __name__ == "__main__":
-    fetch_and_log_reminders()
+    parser = argparse.ArgumentParser(description=fetch_and_log_reminders.__doc__)
+    parser.add_argument(
+        "--in-process", action="store_true", help="Read orders with the ORM instead of the GraphQL endpoint"
+    )
+    args = parser.parse_args()
+    fetch_and_log_reminders(in_process=args.in_process)
     print("Order reminders processed!")
@@ -0,0 +1,94 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from phonenumber_field.phonenumber import to_python
+
+from .bulk import BATCH_SIZE, chunked
+from .cache import invalidate
+from .models import Customer, Product, Order, OrderLine
+from .search import reindex
+
+PHONE_NUMBERS = [to_python(f"+1202555{i:04d}") for i in range(100)]
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """
+    Lets generated rows carry their own ``auto_now_add`` timestamps so that
+    date filters see a realistic spread instead of a single instant.
+    """
+    saved = [(field, field.auto_now_add) for field in fields]
+    for field, _ in saved:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in saved:
+            field.auto_now_add = auto_now_add
+
+
+def generate(customers, products, orders, seed=0, batch_size=BATCH_SIZE, prefix="customer", days=365, now=None):
+    """
+    Bulk inserts a reproducible synthetic dataset and returns the number of
+    order lines created. Orders get one to three lines priced from the
+    generated products. Timestamps fall in the ``days`` before ``now``.
+    """
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    span = days * 24 * 60 * 60
+
+    def timestamp():
+        return now - timedelta(seconds=rng.randrange(span))
+
+    with explicit_timestamps(Customer._meta.get_field("created_at"), Order._meta.get_field("order_date")):
+        customer_ids = []
+        for chunk in chunked(range(customers), batch_size):
+            created = Customer.objects.bulk_create(
+                Customer(
+                    name=f"Customer {i}",
+                    email=f"{prefix}{i}@example.com",
+                    phone=PHONE_NUMBERS[i % len(PHONE_NUMBERS)] if i % 5 == 0 else "",
+                    created_at=timestamp(),
+                )
+                for i in chunk
+            )
+            customer_ids.extend(customer.pk for customer in created)
+            reindex(Customer, [customer.pk for customer in created])
+
+        prices = {}
+        for chunk in chunked(range(products), batch_size):
+            created = Product.objects.bulk_create(
+                Product(name=f"Product {i}", price=Decimal(rng.randrange(100, 100000)) / 100, stock=rng.randrange(0, 500))
+                for i in chunk
+            )
+            prices.update((product.pk, product.price) for product in created)
+            reindex(Product, [product.pk for product in created])
+
+        product_ids = list(prices)
+        line_count = 0
+        if not customer_ids or not product_ids:
+            orders = 0
+        for chunk in chunked(range(orders), batch_size):
+            batch = []
+            for _ in chunk:
+                lines = [
+                    OrderLine(product_id=pid, quantity=rng.randint(1, 3), unit_price=prices[pid])
+                    for pid in rng.sample(product_ids, min(rng.randint(1, 3), len(product_ids)))
+                ]
+                order = Order(
+                    customer_id=rng.choice(customer_ids),
+                    order_date=timestamp(),
+                    total_amount=sum(line.line_total for line in lines),
+                )
+                batch.append((order, lines))
+            Order.objects.bulk_create(order for order, _ in batch)
+            for order, lines in batch:
+                for line in lines:
+                    line.order = order
+            created = OrderLine.objects.bulk_create(line for _, lines in batch for line in lines)
+            line_count += len(created)
+    invalidate(Customer, Product, Order, OrderLine)
+    return line_count
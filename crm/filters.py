@@ -41,4 +41,4 @@ class OrderFilter(django_filters.FilterSet):
         fields = []
 
     def filter_by_product_id(self, queryset, name, value):
-        return queryset.filter(products__id=value)
+        return queryset.filter(lines__product_id=value)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import cache
+from types import SimpleNamespace
+
+from django.conf import settings
+import requests
+from django.db import transaction
+from gql import Client, gql
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from gql.transport.requests import RequestsHTTPTransport
+from graphql import OperationType, get_operation_ast, parse, print_schema
+
+DEFAULT_CLIENT = {
+    "ENDPOINT": "http://localhost:8000/graphql",
+    "IN_PROCESS": False,
+    "SCHEMA_FILE": "/tmp/crm_graphql_schema.json",
+    "TIMEOUT": 15,
+    # Attempts after a failed query. Mutations are never retried: the server
+    # may have applied one whose response was lost.
+    "RETRIES": 2,
+}
+
+
+def client_options():
+    return {**DEFAULT_CLIENT, **getattr(settings, "GRAPHQL_CLIENT", {})}
+
+
+def local_schema():
+    # Imported here, the project schema imports this app's modules.
+    from alx_backend_graphql_crm.schema import schema
+
+    return schema
+
+
+def schema_version():
+    """Hash of the schema this code was deployed with."""
+    return hashlib.sha256(print_schema(local_schema().graphql_schema).encode()).hexdigest()
+
+
+def load_introspection(schema_file, version):
+    try:
+        with open(schema_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached["introspection"] if cached.get("version") == version else None
+
+
+def save_introspection(schema_file, version, introspection):
+    tmp = f"{schema_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": version, "introspection": introspection}, f)
+    os.replace(tmp, schema_file)
+
+
+class HTTPClient:
+    """
+    Talks to the GraphQL endpoint over one ``requests`` session, so calls
+    from the same process share its connection pool instead of opening a
+    connection each.
+
+    The introspection result is cached in ``SCHEMA_FILE`` under the local
+    schema's version: it is fetched once per deploy rather than once per
+    call, and refetched as soon as the schema changes.
+
+    Queries are retried ``retries`` times after a connection error, a
+    timeout or a 5xx response. Mutations are not: the transport's own retries
+    would resend a POST the server may already have applied.
+    """
+
+    backoff = 0.1
+
+    def __init__(self, endpoint, schema_file, timeout=None, retries=0):
+        self.schema_file = schema_file
+        self.version = schema_version()
+        self.retries = retries
+        introspection = load_introspection(schema_file, self.version)
+        self.client = Client(
+            transport=RequestsHTTPTransport(url=endpoint, timeout=timeout),
+            introspection=introspection,
+            fetch_schema_from_transport=introspection is None,
+        )
+        self.session = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.session is None:
+                fetched = self.client.schema is None
+                self.session = self.client.connect_sync()
+                if fetched:
+                    save_introspection(self.schema_file, self.version, self.client.introspection)
+        return self.session
+
+    def execute(self, query, variables=None):
+        document = gql(query)
+        operation = get_operation_ast(document.document)
+        is_mutation = operation is not None and operation.operation == OperationType.MUTATION
+        retries = 0 if is_mutation else self.retries
+        for attempt in range(retries + 1):
+            try:
+                return self.connect().execute(document, variable_values=variables)
+            except (requests.ConnectionError, requests.Timeout, TransportServerError) as e:
+                if attempt == retries or (isinstance(e, TransportServerError) and (e.code or 500) < 500):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.client.close_sync()
+                self.session = None
+
+
+class InProcessClient:
+    """
+    Runs operations with ``schema.execute`` in the current process, for
+    jobs that already run inside Django. Mutations are atomic, as they are
+    behind the view.
+    """
+
+    def execute(self, query, variables=None):
+        schema = local_schema()
+        document = parse(query)
+        operation = get_operation_ast(document)
+        options = {"variable_values": variables, "context_value": SimpleNamespace()}
+        if operation is not None and operation.operation == OperationType.MUTATION:
+            with transaction.atomic():
+                result = schema.execute(query, **options)
+                if result.errors:
+                    transaction.set_rollback(True)
+        else:
+            result = schema.execute(query, **options)
+        if result.errors:
+            raise TransportQueryError(
+                str(result.errors[0]), errors=[error.formatted for error in result.errors], data=result.data
+            )
+        return result.data
+
+    def close(self):
+        pass
+
+
+@cache
+def _client(in_process):
+    if in_process:
+        return InProcessClient()
+    options = client_options()
+    return HTTPClient(options["ENDPOINT"], options["SCHEMA_FILE"], options["TIMEOUT"], options["RETRIES"])
+
+
+def get_client(in_process=None):
+    """
+    Returns the process-wide client. ``in_process`` defaults to the
+    ``GRAPHQL_CLIENT["IN_PROCESS"]`` setting.
+    """
+    if in_process is None:
+        in_process = client_options()["IN_PROCESS"]
+    return _client(bool(in_process))
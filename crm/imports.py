@@ -0,0 +1,150 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import BATCH_SIZE, build_customers, chunked
+from .cache import invalidate
+from .models import Customer, ImportJob
+from .search import reindex
+
+IMPORT_DIR = "imports"
+
+DEFAULT_IMPORT = {
+    # Largest upload CustomerImportView accepts, in bytes.
+    "MAX_UPLOAD_SIZE": 100 * 1024 * 1024,
+}
+# Per-row errors kept on the job; failed_rows still counts every one.
+MAX_STORED_ERRORS = 1000
+
+CONTENT_TYPES = {
+    "text/csv": ImportJob.CSV,
+    "application/x-ndjson": ImportJob.NDJSON,
+    "application/jsonl": ImportJob.NDJSON,
+}
+
+
+def import_options():
+    return {**DEFAULT_IMPORT, **getattr(settings, "CUSTOMER_IMPORT", {})}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class LimitedReader:
+    """Reads ``stream``, raising UploadTooLarge once more than ``limit`` bytes have been read."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.limit:
+            raise UploadTooLarge(f"Uploads are limited to {self.limit} bytes.")
+        return data
+
+
+def create_import(content, format, total_rows=None):
+    """
+    Copies ``content`` (a ``File``, read chunk by chunk) to the default
+    storage and queues an ImportJob for it once the transaction commits.
+    A copy that fails part way, such as an upload over the size limit, is
+    deleted.
+    """
+    # Imported here, crm.tasks imports this module.
+    from .tasks import import_customers
+
+    job = ImportJob(format=format, total_rows=total_rows)
+    name = f"{IMPORT_DIR}/{job.pk}.{format}"
+    try:
+        job.source = default_storage.save(name, content)
+    except Exception:
+        default_storage.delete(name)
+        raise
+    job.save()
+    transaction.on_commit(lambda: import_customers.delay(str(job.pk)))
+    return job
+
+
+def import_rows(rows):
+    """Queues already parsed rows, such as a mutation's input, as an NDJSON import."""
+    rows = list(rows)
+    content = ContentFile("".join(json.dumps(dict(row)) + "\n" for row in rows))
+    return create_import(content, ImportJob.NDJSON, total_rows=len(rows))
+
+
+def read_rows(job):
+    """
+    Streams the rows of a job's file as dicts, or None for a line that is
+    not a JSON object.
+    """
+    with default_storage.open(job.source, "rb") as f:
+        lines = codecs.iterdecode(f, "utf-8-sig")
+        if job.format == ImportJob.CSV:
+            yield from csv.DictReader(lines)
+            return
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def import_chunk(job, rows, offset):
+    customers, errors = build_customers(rows, offset)
+    with transaction.atomic():
+        created = Customer.objects.bulk_create(customers)
+        reindex(Customer, [customer.pk for customer in created])
+        job.processed_rows += len(rows)
+        job.created_rows += len(created)
+        job.failed_rows += len(errors)
+        job.errors = (job.errors + errors)[:MAX_STORED_ERRORS]
+        job.save(update_fields=["processed_rows", "created_rows", "failed_rows", "errors"])
+        invalidate(Customer)
+
+
+def run_import(job_id, chunk_size=BATCH_SIZE):
+    """
+    Imports a job's rows in chunks of ``chunk_size``, each in its own
+    transaction. A job interrupted part way resumes after the last
+    committed chunk when it runs again. The job's file is deleted once it
+    has succeeded or failed, which are final.
+    """
+    job = ImportJob.objects.get(pk=job_id)
+    if job.status in (ImportJob.SUCCEEDED, ImportJob.FAILED):
+        return job
+
+    job.status = ImportJob.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    if job.total_rows is None:
+        # One cheap pass over the file so progress can be reported.
+        job.total_rows = sum(1 for _ in read_rows(job))
+    job.save(update_fields=["status", "started_at", "total_rows"])
+
+    try:
+        rows = read_rows(job)
+        offset = job.processed_rows
+        for chunk in chunked(islice(rows, offset, None), chunk_size):
+            import_chunk(job, chunk, offset)
+            offset += len(chunk)
+    except Exception as e:
+        job.status, job.message = ImportJob.FAILED, str(e)
+    else:
+        job.status = ImportJob.SUCCEEDED
+    default_storage.delete(job.source)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "message", "finished_at"])
+    return job
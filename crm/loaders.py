@@ -0,0 +1,284 @@
+import asyncio
+from collections import defaultdict
+
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphql.execution.values import get_argument_values
+from graphql_relay import from_global_id
+
+from crm.models import Customer, Product, Order, OrderLine
+
+# Root fields that look records up by primary key, and the model they load.
+LOOKUP_FIELDS = {"customerById": Customer, "productById": Product, "orderById": Order}
+
+
+class BatchLoader:
+    """
+    Per-request loader that collects keys and resolves every pending key
+    with a single query the first time one of them is requested.
+    ``aload`` does the same with ``abatch_load`` on the async ORM; lookups
+    awaited concurrently share the batch already in flight.
+    """
+
+    def __init__(self, batch_load, default_factory=lambda: None, on_load=None, abatch_load=None):
+        self.batch_load = batch_load
+        self.default_factory = default_factory
+        self.on_load = on_load
+        self.abatch_load = abatch_load
+        self._cache = {}
+        self._pending = set()
+        self._loading = {}
+
+    def prime(self, keys):
+        self._pending.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._pending.add(key)
+            keys, self._pending = self._pending, set()
+            try:
+                results = self.batch_load(list(keys))
+            except Exception:
+                # Keep the batch queued so that a retry still loads it in one query.
+                self._pending |= keys
+                raise
+            self._store(keys, results)
+        return self._cache[key]
+
+    async def aload(self, key):
+        if key not in self._cache:
+            if key not in self._loading:
+                self._pending.add(key)
+                keys, self._pending = self._pending, set()
+                batch = asyncio.ensure_future(self._aload_batch(keys))
+                self._loading.update(dict.fromkeys(keys, batch))
+            await self._loading[key]
+        return self._cache[key]
+
+    async def _aload_batch(self, keys):
+        try:
+            results = await self.abatch_load(list(keys))
+        except Exception:
+            self._pending |= keys
+            raise
+        finally:
+            for k in keys:
+                self._loading.pop(k, None)
+        self._store(keys, results)
+
+    def _store(self, keys, results):
+        for k in keys:
+            self._cache[k] = results.get(k, self.default_factory())
+        if self.on_load:
+            self.on_load(results.values())
+
+
+def load_customers(keys):
+    return Customer.objects.in_bulk(keys)
+
+
+def load_products(keys):
+    return Product.objects.in_bulk(keys)
+
+
+def load_orders(keys):
+    return Order.objects.in_bulk(keys)
+
+
+async def aload_customers(keys):
+    return await Customer.objects.ain_bulk(keys)
+
+
+async def aload_products(keys):
+    return await Product.objects.ain_bulk(keys)
+
+
+async def aload_orders(keys):
+    return await Order.objects.ain_bulk(keys)
+
+
+def load_lines_by_order(keys):
+    lines = defaultdict(list)
+    for line in OrderLine.objects.filter(order_id__in=keys).select_related("product").order_by("pk"):
+        lines[line.order_id].append(line)
+    return lines
+
+
+def load_orders_by_customer(keys):
+    orders = defaultdict(list)
+    for order in Order.objects.filter(customer_id__in=keys).order_by("pk"):
+        orders[order.customer_id].append(order)
+    return orders
+
+
+def load_orders_by_product(keys):
+    orders = defaultdict(list)
+    for line in OrderLine.objects.filter(product_id__in=keys).select_related("order").order_by("pk"):
+        orders[line.product_id].append(line.order)
+    return orders
+
+
+class Loaders:
+    def __init__(self):
+        # Whatever one level loads is primed for the next, so nested lists
+        # resolved parent by parent still share a single query per level.
+        self.customer = BatchLoader(load_customers, on_load=self.prime, abatch_load=aload_customers)
+        self.product = BatchLoader(load_products, on_load=self.prime, abatch_load=aload_products)
+        self.order = BatchLoader(load_orders, on_load=self.prime, abatch_load=aload_orders)
+        self.lines_by_order = BatchLoader(load_lines_by_order, list, self.prime_lists)
+        self.orders_by_customer = BatchLoader(load_orders_by_customer, list, self.prime_lists)
+        self.orders_by_product = BatchLoader(load_orders_by_product, list, self.prime_lists)
+        self._primed_operations = set()
+
+    def for_model(self, model):
+        return {Customer: self.customer, Product: self.product, Order: self.order}[model]
+
+    def prime_lookups(self, info):
+        """
+        Queues every by-id and ``node``/``nodes`` lookup at the root of the
+        operation, so the first one loads them all with one query per model.
+        Root fields resolve one after the other, there is no later point at
+        which the keys could be collected.
+        """
+        if id(info.operation) in self._primed_operations:
+            return
+        self._primed_operations.add(id(info.operation))
+        for model, pk in root_lookups(info):
+            self.for_model(model).prime([pk])
+
+    def prime_lists(self, node_lists):
+        for nodes in node_lists:
+            self.prime(nodes)
+
+    def prime(self, nodes, seen=None):
+        """
+        Queues the relation keys of a list of sibling nodes so that the first
+        nested lookup fetches the whole level in one query.
+        """
+        seen = set() if seen is None else seen
+        for node in nodes:
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, Order):
+                # Skip the FK when it was deferred by only(); reading it would query.
+                if "customer_id" in node.__dict__:
+                    self.customer.prime([node.customer_id])
+                self.lines_by_order.prime([node.pk])
+            elif isinstance(node, Customer):
+                self.orders_by_customer.prime([node.pk])
+            elif isinstance(node, Product):
+                self.orders_by_product.prime([node.pk])
+            elif isinstance(node, OrderLine):
+                if "product_id" in node.__dict__:
+                    self.product.prime([node.product_id])
+            # Relations fetched by select/prefetch_related are the next level down.
+            self.prime(node._state.fields_cache.values(), seen)
+            for related in getattr(node, "_prefetched_objects_cache", {}).values():
+                self.prime(related, seen)
+
+
+# Range of BigAutoField keys; larger values overflow the database's integers.
+MAX_PK = 2 ** 63 - 1
+
+
+def parse_pk(value):
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    return pk if 0 < pk <= MAX_PK else None
+
+
+def global_id_lookup(info, global_id):
+    """Returns the model and primary key a relay global ID points to, or None."""
+    try:
+        type_name, pk = from_global_id(global_id)
+    except Exception:
+        return None
+    graphql_type = info.schema.get_type(type_name)
+    model = getattr(getattr(getattr(graphql_type, "graphene_type", None), "_meta", None), "model", None)
+    pk = parse_pk(pk)
+    if model not in LOOKUP_FIELDS.values() or pk is None:
+        return None
+    return model, pk
+
+
+def root_fields(info, selection_set):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from root_fields(info, selection.selection_set)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from root_fields(info, fragment.selection_set)
+
+
+def root_lookups(info):
+    """Yields ``(model, pk)`` for every primary key lookup at the root of the operation."""
+    root_type = info.schema.get_root_type(info.operation.operation)
+    for field in root_fields(info, info.operation.selection_set):
+        name = field.name.value
+        field_def = root_type.fields.get(name)
+        if field_def is None or (name not in LOOKUP_FIELDS and name not in ("node", "nodes")):
+            continue
+        try:
+            args = get_argument_values(field_def, field, info.variable_values)
+        except Exception:
+            # Invalid arguments are reported when the field itself resolves.
+            continue
+        if name in LOOKUP_FIELDS:
+            yield LOOKUP_FIELDS[name], args["id"]
+            continue
+        for global_id in [args["id"]] if name == "node" else args["ids"]:
+            lookup = global_id_lookup(info, global_id)
+            if lookup is not None:
+                yield lookup
+
+
+def load_object(info, model, pk):
+    """
+    Loads a ``model`` instance by primary key through the request's loaders,
+    batched with every other lookup of the operation. Returns None when it
+    does not exist.
+    """
+    loaders = get_loaders(info)
+    loaders.prime_lookups(info)
+    pk = parse_pk(pk)
+    return None if pk is None else loaders.for_model(model).load(pk)
+
+
+async def aload_object(info, model, pk):
+    """``load_object`` for async resolvers, on the async ORM."""
+    loaders = get_loaders(info)
+    loaders.prime_lookups(info)
+    pk = parse_pk(pk)
+    return None if pk is None else await loaders.for_model(model).aload(pk)
+
+
+def cached_relation(instance, name):
+    """
+    Returns a relation already fetched by select_related/prefetch_related,
+    or None when it still has to be loaded.
+    """
+    field = instance._meta.get_field(name)
+    if field.many_to_one:
+        return getattr(instance, name) if field.is_cached(instance) else None
+    prefetched = getattr(instance, "_prefetched_objects_cache", {})
+    if name in prefetched:
+        return list(prefetched[name])
+    return None
+
+
+def get_loaders(info):
+    """
+    Returns the loaders bound to the current request, creating them on first use.
+    """
+    context = info.context
+    loaders = getattr(context, "crm_loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.crm_loaders = loaders
+    return loaders
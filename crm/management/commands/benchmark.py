@@ -0,0 +1,408 @@
+import json
+import re
+import subprocess
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.utils import timezone
+from graphql_relay import to_global_id
+from phonenumber_field.phonenumber import to_python
+
+from crm.datagen import generate
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.models import Customer, Product, Order
+from crm.rollups import refresh_daily_stats
+from crm.schema import BulkCreateCustomers, BulkCreateOrders, CreateOrder, CustomerInput, OrderInput
+from crm.search import search
+
+
+def legacy_bulk_create_customers(input):
+    # Row-by-row implementation kept as the baseline for comparison.
+    created_customers = []
+    for customer_data in input:
+        if Customer.objects.filter(email=customer_data.email).exists():
+            continue
+        phone_number = None
+        if customer_data.phone:
+            try:
+                phone_number = to_python(customer_data.phone)
+                if not phone_number.is_valid():
+                    continue
+            except Exception:
+                continue
+        customer = Customer(name=customer_data.name, email=customer_data.email)
+        if phone_number:
+            customer.phone = phone_number
+        customer.save()
+        created_customers.append(customer)
+    return created_customers
+
+
+def customer_rows(size):
+    return [
+        CustomerInput._meta.container({
+            "name": f"Customer {i}",
+            "email": f"bench-{size}-{i}@example.com",
+            "phone": "+12025550123" if i % 10 == 0 else None,
+        })
+        for i in range(size)
+    ]
+
+
+def bulk_customers(size):
+    return lambda: customer_rows(size), {
+        "before": legacy_bulk_create_customers,
+        "after": lambda rows: BulkCreateCustomers.mutate(None, None, rows),
+    }
+
+
+def order_rows(size):
+    customers = Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"bench-orders-{i}@example.com") for i in range(100)
+    )
+    products = Product.objects.bulk_create(
+        # Enough stock that every order is filled.
+        Product(name=f"Product {i}", price=i + 1, stock=size) for i in range(50)
+    )
+    return [
+        OrderInput._meta.container({
+            "customer_id": customers[i % len(customers)].pk,
+            "product_ids": [products[(i + j) % len(products)].pk for j in range(3)],
+            "order_date": None,
+        })
+        for i in range(size)
+    ]
+
+
+def bulk_orders(size):
+    return lambda: order_rows(size), {
+        "before": lambda rows: [CreateOrder.mutate(None, None, row) for row in rows],
+        "after": lambda rows: BulkCreateOrders.mutate(None, None, rows),
+    }
+
+
+def filter_querysets():
+    today = timezone.now().date()
+    customer = Customer.objects.order_by("pk").last()
+    return {
+        "customer name": CustomerFilter({"name": "customer 4242"}, Customer.objects.all()).qs,
+        "customer email": CustomerFilter({"email": "4242@"}, Customer.objects.all()).qs,
+        "customer created_at": CustomerFilter({"created_at_gte": today}, Customer.objects.all()).qs,
+        "customer phone": CustomerFilter({"phone_pattern": "+12025550042"}, Customer.objects.all()).qs,
+        "product name": ProductFilter({"name": "product 4242"}, Product.objects.all()).qs,
+        "product price": ProductFilter({"price_gte": 995}, Product.objects.all()).qs,
+        "product stock": ProductFilter({"stock_lte": 1}, Product.objects.all()).qs,
+        "order total": OrderFilter({"total_amount_gte": 2900}, Order.objects.all()).qs,
+        "order date": OrderFilter({"order_date_gte": today}, Order.objects.all()).qs,
+        "customer orders by date": Order.objects.filter(
+            customer=customer, order_date__gte=timezone.now() - timedelta(days=7)
+        ),
+    }
+
+
+def plan_summary(queryset):
+    # SQLite reports SCAN/SEARCH, PostgreSQL "Seq Scan"/"Index Scan"/"Bitmap ...".
+    return "; ".join(
+        line.strip() for line in queryset.explain().splitlines() if re.search(r"SCAN|SEARCH|Scan", line)
+    )
+
+
+def drop_filter_indexes():
+    # Only ever called inside the benchmark's rolled-back transaction.
+    names = [index.name for model in (Customer, Product, Order) for index in model._meta.indexes]
+    if connection.vendor == "postgresql":
+        names += ["crm_customer_name_trgm", "crm_customer_email_trgm", "crm_customer_phone_pattern", "crm_product_name_trgm"]
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}")
+
+
+def explain_filters():
+    lines = []
+    for label, queryset in filter_querysets().items():
+        start = time.perf_counter()
+        queryset.count()
+        elapsed = time.perf_counter() - start
+        lines.append(f"  {label:<24} {elapsed * 1000:9.1f}ms  {plan_summary(queryset)}")
+    return "\n".join(lines)
+
+
+def filter_plans(size):
+    def setup():
+        generate(size, max(size // 10, 1), size, prefix=f"bench-filters-{size}-")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    return setup, {
+        "before": lambda _: drop_filter_indexes() or explain_filters(),
+        "after": lambda _: explain_filters(),
+    }
+
+
+def search_box(size):
+    # Search box lookups through the icontains filters and through the search
+    # index, for a selective term and for one with a word every row contains.
+    terms = (f"{size // 2}", f"customer {size // 2}")
+
+    def setup():
+        generate(size, max(size // 10, 1), 0, prefix=f"bench-search-{size}-")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def icontains(term):
+        customers = CustomerFilter({"name": term}, Customer.objects.all()).qs
+        products = ProductFilter({"name": term}, Product.objects.all()).qs
+        return lambda _: list(customers.values_list("pk", flat=True)[:20]) + list(products.values_list("pk", flat=True)[:20])
+
+    variants = {}
+    for term in terms:
+        variants[f"icontains '{term}'"] = icontains(term)
+        variants[f"index '{term}'"] = lambda _, term=term: search(term, limit=20)
+    return setup, variants
+
+
+def deep_pages(size):
+    # Fetches the final page of allOrders' ordering with OFFSET and with a keyset predicate.
+    ordering = ("order_date", "id")
+
+    def setup():
+        generate(max(size // 10, 1), 10, size, prefix=f"bench-pages-{size}-")
+        return Order.objects.order_by(*ordering).values_list(*ordering)[max(size - 51, 0)]
+
+    def keyset_page(cursor):
+        order_date, pk = cursor
+        after = Q(order_date__gte=order_date) & (Q(order_date__gt=order_date) | Q(order_date=order_date, id__gt=pk))
+        return list(Order.objects.filter(after).order_by(*ordering)[:50])
+
+    return setup, {
+        "offset": lambda _: list(Order.objects.order_by(*ordering)[max(size - 50, 0):size]),
+        "keyset": keyset_page,
+    }
+
+
+API_OPERATIONS = {
+    "allCustomers": (
+        "query($first: Int) { allCustomers(first: $first) { edges { node { name email "
+        "orders(first: 5) { edges { node { totalAmount } } } } } } }",
+        lambda ids: {"first": 50},
+    ),
+    "allCustomers(name)": (
+        "query($name: String) { allCustomers(first: 50, name: $name) { edges { node { name email } } } }",
+        lambda ids: {"name": "customer 4"},
+    ),
+    "allProducts": (
+        "{ allProducts(first: 50, priceGte: 100) { totalCount edges { node { name price stock } } } }",
+        lambda ids: {},
+    ),
+    "allOrders": (
+        "query($first: Int) { allOrders(first: $first) { totalCount edges { node { totalAmount orderDate "
+        "customer { name } lines { quantity unitPrice product { name } } } } } }",
+        lambda ids: {"first": 50},
+    ),
+    "customerById": (
+        "query($id: Int!) { customerById(id: $id) { name email orders { edges { node { totalAmount } } } } }",
+        lambda ids: {"id": ids["customer"]},
+    ),
+    "productById": (
+        "query($id: Int!) { productById(id: $id) { name price stock } }",
+        lambda ids: {"id": ids["products"][0]},
+    ),
+    "orderById": (
+        "query($id: Int!) { orderById(id: $id) { totalAmount customer { name } lines { quantity product { name } } } }",
+        lambda ids: {"id": ids["order"]},
+    ),
+    "node": (
+        "query($id: ID!) { node(id: $id) { ... on OrderType { totalAmount customer { name } } } }",
+        lambda ids: {"id": to_global_id("OrderType", ids["order"])},
+    ),
+    "nodes": (
+        "query($ids: [ID!]!) { nodes(ids: $ids) { ... on CustomerType { name email } } }",
+        lambda ids: {"ids": [to_global_id("CustomerType", pk) for pk in ids["customers"]]},
+    ),
+    "search": (
+        "query($term: String!) { search(term: $term, first: 20) { ... on CustomerType { name email } "
+        "... on ProductType { name price } } }",
+        lambda ids: {"term": "customer 4"},
+    ),
+    "crmStats": (
+        "{ crmStats { customers orders revenue days { date orders revenue } } }",
+        lambda ids: {},
+    ),
+    "createCustomer": (
+        "mutation($input: CustomerInput!) { createCustomer(input: $input) { customer { id } } }",
+        lambda ids: {"input": {"name": "Bench", "email": "bench-api@example.com", "phone": "+12025550123"}},
+    ),
+    "bulkCreateCustomers": (
+        "mutation($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) { customers { id } errors { index } } }",
+        lambda ids: {"input": [{"name": f"Bench {i}", "email": f"bench-api-{i}@example.com"} for i in range(100)]},
+    ),
+    "createProduct": (
+        "mutation($input: ProductInput!) { createProduct(input: $input) { product { id } } }",
+        lambda ids: {"input": {"name": "Bench", "price": "9.99", "stock": 5}},
+    ),
+    "createOrder": (
+        "mutation($input: OrderInput!) { createOrder(input: $input) { order { id totalAmount } } }",
+        lambda ids: {"input": {"customerId": ids["customer"], "productIds": ids["products"][:3]}},
+    ),
+    "bulkCreateOrders": (
+        "mutation($input: [OrderInput!]!) { bulkCreateOrders(input: $input) { orders { id } errors { index } } }",
+        lambda ids: {"input": [{"customerId": ids["customer"], "productIds": ids["products"][:3]} for _ in range(100)]},
+    ),
+    "updateLowStockProducts": (
+        "mutation { updateLowStockProducts { updatedProducts { id } } }",
+        lambda ids: {},
+    ),
+}
+
+
+def api(size):
+    # Every query and mutation of crm/schema.py, sent through the GraphQL view.
+    client = Client()
+
+    def setup():
+        generate(size, max(size // 10, 10), size, prefix=f"bench-api-{size}-")
+        refresh_daily_stats()
+        products = list(Product.objects.order_by("-pk").values_list("pk", flat=True)[:3])
+        # Every run's createOrder and bulkCreateOrders take stock from these.
+        Product.objects.filter(pk__in=products).update(stock=1_000_000)
+        return {
+            "customer": Customer.objects.order_by("pk").values_list("pk", flat=True).last(),
+            "customers": list(Customer.objects.order_by("-pk").values_list("pk", flat=True)[:50]),
+            "products": products,
+            "order": Order.objects.order_by("pk").values_list("pk", flat=True).last(),
+        }
+
+    def operation(query, variables):
+        def run(ids):
+            response = client.post(
+                "/graphql", json.dumps({"query": query, "variables": variables(ids)}), content_type="application/json"
+            )
+            body = response.json()
+            if body.get("errors"):
+                raise CommandError(f"{query}: {body['errors']}")
+        return run
+
+    return setup, {label: operation(query, variables) for label, (query, variables) in API_OPERATIONS.items()}
+
+
+SCENARIOS = {
+    "api": api,
+    "deep_pages": deep_pages,
+    "bulk_customers": bulk_customers,
+    "bulk_orders": bulk_orders,
+    "filter_plans": filter_plans,
+    "search": search_box,
+}
+
+
+# Scenarios whose size is the number of rows each run writes.
+WRITE_SCENARIOS = {"bulk_customers", "bulk_orders"}
+
+
+class QueryCounter:
+    """
+    Counts the statements sent while installed as an execute wrapper.
+    ``connection.queries`` keeps at most 9000 entries, fewer than the larger
+    sizes send.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks CRM operations inside transactions that are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=1, help='Runs per variant, for latency percentiles')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare the median against')
+
+    def measure(self, run, rows, repeat):
+        timings, query_counts, result = [], [], None
+        for _ in range(repeat):
+            # Each run gets its own savepoint so every run sees the same data.
+            counter = QueryCounter()
+            with transaction.atomic(), connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                result = run(rows)
+                timings.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+            query_counts.append(counter.count)
+        return timings, query_counts, result
+
+    # The API scenario's test client sends requests as "testserver".
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        scenario, repeat = options['scenario'], options['repeat']
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = {(r['scenario'], r['variant'], r['size']): r for r in json.load(f)['results']}
+
+        results = []
+        for size in options['sizes']:
+            setup, variants = SCENARIOS[scenario](size)
+            with transaction.atomic():
+                rows = setup()
+                for label, run in variants.items():
+                    timings, query_counts, result = self.measure(run, rows, repeat)
+                    record = {
+                        "scenario": scenario,
+                        "variant": label,
+                        "size": size,
+                        "runs": repeat,
+                        "p50": percentile(timings, 0.5),
+                        "p95": percentile(timings, 0.95),
+                        "p99": percentile(timings, 0.99),
+                        "queries": max(query_counts),
+                    }
+                    results.append(record)
+                    line = (
+                        f"{scenario} {label:>24} rows={size:<7} p50={record['p50'] * 1000:9.1f}ms "
+                        f"p95={record['p95'] * 1000:9.1f}ms queries={record['queries']}"
+                    )
+                    if scenario in WRITE_SCENARIOS:
+                        line += f" {size / record['p50']:12.0f} rows/sec"
+                    previous = baseline.get((scenario, label, size))
+                    if previous:
+                        line += f"  p50 {(record['p50'] / previous['p50'] - 1) * 100:+.1f}% vs {previous.get('commit') or 'baseline'}"
+                    self.stdout.write(line)
+                    if isinstance(result, str):
+                        self.stdout.write(result)
+                transaction.set_rollback(True)
+
+        if options['output']:
+            commit = current_commit()
+            for record in results:
+                record["commit"] = commit
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    "commit": commit,
+                    "vendor": connection.vendor,
+                    "created": timezone.now().isoformat(),
+                    "results": results,
+                }, f, indent=2)
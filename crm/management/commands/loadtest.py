@@ -0,0 +1,302 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from copy import deepcopy
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.test import AsyncClient, Client, override_settings
+
+from crm.models import Customer, Order, OrderLine, Product
+
+QUERY = """
+    query($first: Int) {
+      allOrders(first: $first) { edges { node { totalAmount customer { name } lines { quantity } } } }
+    }
+"""
+
+
+ORDER_MUTATION = """
+    mutation($input: OrderInput!) {
+      createOrder(input: $input) { order { id } }
+    }
+"""
+
+
+def request_body(page_size):
+    return json.dumps({"query": QUERY, "variables": {"first": page_size}})
+
+
+def run_wsgi(url, bodies, concurrency, requests):
+    # A thread per in-flight request, as a threaded WSGI server would use.
+    local = threading.local()
+
+    def send(i):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        start = time.perf_counter()
+        # The test client stops Django from closing connections around a
+        # request; a server does, according to CONN_MAX_AGE.
+        close_old_connections()
+        response = local.client.post(url, bodies[i % len(bodies)], content_type="application/json")
+        close_old_connections()
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - start, response.json()
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, range(requests)))
+
+
+def run_asgi(url, bodies, concurrency, requests):
+    async def main():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(i):
+            # ASGIHandler gives each request its own thread for sync code;
+            # the test client's handler does not, so do it here.
+            async with slots, ThreadSensitiveContext():
+                start = time.perf_counter()
+                await sync_to_async(close_old_connections)()
+                response = await client.post(url, bodies[i % len(bodies)], content_type="application/json")
+                await sync_to_async(close_old_connections)()
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - start, response.json()
+
+        return await asyncio.gather(*(send(i) for i in range(requests)))
+
+    return asyncio.run(main())
+
+
+MODES = {
+    "wsgi": ("/graphql", run_wsgi),
+    # The synchronous view behind the ASGI handler, which runs it in a thread.
+    "asgi-sync": ("/graphql", run_asgi),
+    "asgi": ("/graphql/async", run_asgi),
+}
+
+
+def add_query_latency(seconds):
+    """Sleeps before every SQL statement, to model a database across the network."""
+
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(install, weak=False)
+
+
+def add_connect_latency(seconds):
+    """
+    Sleeps whenever Django opens a database connection, to model the TCP,
+    TLS and authentication round trips of a database across the network.
+    Connections a pool hands out were opened by the pool, and are free.
+    """
+
+    def install(sender, connection, **kwargs):
+        if getattr(connection, "pool", None) is None:
+            time.sleep(seconds)
+
+    connection_created.connect(install, weak=False)
+
+
+class ConnectionCounter:
+    """Counts the database connections Django opens, other than pool checkouts."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        connection_created.connect(self.opened, weak=False)
+
+    def opened(self, sender, connection, **kwargs):
+        if getattr(connection, "pool", None) is None:
+            with self.lock:
+                self.count += 1
+
+    def take(self):
+        with self.lock:
+            count, self.count = self.count, 0
+        return count
+
+
+CONNECTION_POLICIES = {
+    # Django's default: each request opens and closes its own connection.
+    "per-request": {"CONN_MAX_AGE": 0},
+    # Each thread keeps its connection, checked before reuse, across requests.
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    # Requests borrow a connection from Django's psycopg pool (PostgreSQL only).
+    "pool": {"CONN_MAX_AGE": 0, "OPTIONS": {"pool": True}},
+}
+
+
+@contextmanager
+def connection_policy(name, alias=DEFAULT_DB_ALIAS):
+    """
+    Applies a CONNECTION_POLICIES entry to ``alias`` for the connections
+    opened inside the block. Every thread's connection shares the settings
+    dict changed here.
+    """
+    if name == "pool" and connections[alias].vendor != "postgresql":
+        raise CommandError("The pool policy needs PostgreSQL with psycopg 3 and psycopg-pool.")
+    settings_dict = connections.settings[alias]
+    saved = deepcopy(settings_dict)
+    overrides = CONNECTION_POLICIES[name]
+    settings_dict.update({**overrides, "OPTIONS": {**settings_dict["OPTIONS"], **overrides.get("OPTIONS", {})}})
+    connections[alias].close()
+    try:
+        yield
+    finally:
+        connections[alias].close()
+        settings_dict.clear()
+        settings_dict.update(saved)
+
+
+def create_stock(products, stock):
+    customer, _ = Customer.objects.get_or_create(email="loadtest@example.com", defaults={"name": "Load Test"})
+    products = Product.objects.bulk_create(
+        Product(name=f"Load test product {i}", price=1, stock=stock) for i in range(products)
+    )
+    return customer, [product.pk for product in products]
+
+
+def order_bodies(customer, product_ids, count, rng):
+    """
+    Orders of one to three units of one to three of ``product_ids``, listed
+    in random order so concurrent orders ask for the same rows in different
+    orders.
+    """
+    bodies = []
+    for _ in range(count):
+        products = rng.sample(product_ids, rng.randint(1, min(3, len(product_ids))))
+        requested = [pid for pid in products for _ in range(rng.randint(1, 3))]
+        rng.shuffle(requested)
+        bodies.append(json.dumps({
+            "query": ORDER_MUTATION,
+            "variables": {"input": {"customerId": customer.pk, "productIds": requested}},
+        }))
+    return bodies
+
+
+def check_stock(product_ids, stock):
+    """
+    Returns ``(units sold, problems)`` for the load test products, where
+    every unit sold must be a line of a created order and be missing from
+    stock.
+    """
+    problems = []
+    sold = dict(
+        OrderLine.objects.filter(product__in=product_ids).values("product").annotate(units=Sum("quantity"))
+        .values_list("product", "units")
+    )
+    for pk, left in Product.objects.filter(pk__in=product_ids).values_list("pk", "stock"):
+        units = sold.get(pk, 0)
+        if units > stock:
+            problems.append(f"product {pk} oversold: {units} units of {stock}")
+        if units + left != stock:
+            problems.append(f"product {pk}: {units} units sold but stock went from {stock} to {left}")
+    return sum(sold.values()), problems
+
+
+def delete_stock(customer, product_ids):
+    Order.objects.filter(lines__product__in=product_ids).delete()
+    Product.objects.filter(pk__in=product_ids).delete()
+    if not customer.orders.exists():
+        customer.delete()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares GraphQL throughput of the sync (WSGI) and async (ASGI) views under concurrent clients, '
+        'or with --orders checks that concurrent orders never oversell stock. With --connections, repeats '
+        'the runs per database connection policy to measure connection overhead per request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[50, 200, 1000])
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode and concurrency level')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--query-latency', type=float, default=0, help='Milliseconds added to every SQL query')
+        parser.add_argument(
+            '--orders', action='store_true',
+            help='Send concurrent createOrder mutations for a few products and check none is oversold',
+        )
+        parser.add_argument('--products', type=int, default=5, help='Products the --orders clients compete for')
+        parser.add_argument('--stock', type=int, default=200, help='Starting stock of each --orders product')
+        parser.add_argument(
+            '--connections', nargs='+', choices=list(CONNECTION_POLICIES),
+            help='Connection policies to compare, instead of the configured CONN_MAX_AGE and pool',
+        )
+        parser.add_argument(
+            '--connect-latency', type=float, default=0, help='Milliseconds added to opening a database connection'
+        )
+
+    # The in-process clients send requests as "testserver".
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        if options['query_latency']:
+            add_query_latency(options['query_latency'] / 1000)
+        if options['connect_latency']:
+            add_connect_latency(options['connect_latency'] / 1000)
+        self.opened = ConnectionCounter()
+        for policy in options['connections'] or [None]:
+            with connection_policy(policy) if policy else nullcontext():
+                for concurrency in options['concurrency']:
+                    for mode in options['modes']:
+                        label = f"{mode} {policy}" if policy else mode
+                        if options['orders']:
+                            self.run_orders(label, mode, concurrency, options)
+                        else:
+                            bodies = [request_body(options['page_size'])]
+                            self.run(label, mode, concurrency, bodies, options['requests'])
+
+    def run(self, label, mode, concurrency, bodies, requests):
+        url, run = MODES[mode]
+        self.opened.take()
+        start = time.perf_counter()
+        results = run(url, bodies, concurrency, requests)
+        elapsed = time.perf_counter() - start
+        latencies = [seconds for seconds, _ in results]
+        p50, p95, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 94, 98))
+        self.stdout.write(
+            f"{label} clients={concurrency:<5} {len(latencies) / elapsed:8.0f} req/sec "
+            f"p50={p50 * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms p99={p99 * 1000:7.1f}ms "
+            f"connections opened={self.opened.take() / len(latencies):.2f}/request"
+        )
+        return results
+
+    def run_orders(self, label, mode, concurrency, options):
+        customer, product_ids = create_stock(options['products'], options['stock'])
+        try:
+            bodies = order_bodies(customer, product_ids, options['requests'], random.Random(concurrency))
+            results = self.run(label, mode, concurrency, bodies, options['requests'])
+            outcomes = Counter(
+                "created" if not body.get("errors")
+                else "out of stock" if body["errors"][0]["message"].startswith("Insufficient stock")
+                else body["errors"][0]["message"]
+                for _, body in results
+            )
+            sold, problems = check_stock(product_ids, options['stock'])
+            created = Order.objects.filter(lines__product__in=product_ids).distinct().count()
+            if created != outcomes["created"]:
+                problems.append(f"{outcomes['created']} orders reported created but {created} exist")
+            self.stdout.write(
+                f"    {sold} of {options['stock'] * len(product_ids)} units sold, "
+                + ", ".join(f"{count} {outcome}" for outcome, count in outcomes.most_common())
+            )
+        finally:
+            delete_stock(customer, product_ids)
+        if problems:
+            raise CommandError("; ".join(problems))
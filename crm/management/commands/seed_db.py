@@ -1,41 +1,121 @@
 import random
-from django.core.management.base import BaseCommand
-from crm.models import Customer, Product, Order
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crm.bulk import BATCH_SIZE
+from crm.cache import invalidate
+from crm.datagen import generate
+from crm.models import Customer, Product, Order, OrderLine, DailyStats, RollupWatermark
+from crm.search import SEARCH_FIELDS, reindex
+
+SEEDED_MODELS = (OrderLine, Order, Customer, Product)
+# Derived from the seeded tables. The watermarks hold primary keys, which
+# restart once the sequences are reset, so they go together with the rollups.
+ROLLUP_MODELS = (DailyStats, RollupWatermark)
+
+
+def truncate():
+    """
+    Empties the CRM tables and resets their sequences with the backend's
+    flush statements (TRUNCATE on PostgreSQL) instead of a cascading
+    ``delete()`` that loads every row to collect its relations.
+    """
+    tables = [model._meta.db_table for model in (*SEEDED_MODELS, *ROLLUP_MODELS)]
+    tables.append(Order.products.through._meta.db_table)
+    statements = connection.ops.sql_flush(no_style(), sorted(set(tables)), reset_sequences=True, allow_cascade=True)
+    connection.ops.execute_sql_flush(statements)
+    for model in SEARCH_FIELDS:
+        reindex(model)
+    invalidate(*SEEDED_MODELS, DailyStats)
+
+
+def as_of(value):
+    if value is None or timezone.is_aware(value):
+        return value
+    return timezone.make_aware(value)
+
+
+def seed_fixture(rng):
+    """The small hand-written dataset used by the tests and local development."""
+    customers = Customer.objects.bulk_create([
+        Customer(name='Alice', email='alice@example.com', phone='+1234567890'),
+        Customer(name='Bob', email='bob@example.com', phone='123-456-7890'),
+        Customer(name='Charlie', email='charlie@example.com'),
+    ])
+    products = Product.objects.bulk_create([
+        Product(name='Laptop', price=999.99, stock=10),
+        Product(name='Mouse', price=25.50, stock=50),
+        Product(name='Keyboard', price=75.00, stock=30),
+        Product(name='Monitor', price=300.00, stock=15),
+    ])
+
+    orders = []
+    for customer in customers:
+        for _ in range(rng.randint(1, 3)):
+            lines = [
+                OrderLine(product=product, unit_price=product.price)
+                for product in rng.sample(products, rng.randint(1, len(products)))
+            ]
+            orders.append((Order(customer=customer, total_amount=sum(line.line_total for line in lines)), lines))
+    Order.objects.bulk_create(order for order, _ in orders)
+    for order, lines in orders:
+        for line in lines:
+            line.order = order
+    OrderLine.objects.bulk_create(line for _, lines in orders for line in lines)
+    for model in SEARCH_FIELDS:
+        reindex(model)
+    invalidate(*SEEDED_MODELS)
+
 
 class Command(BaseCommand):
-    help = 'Seeds the database with initial data'
-
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Deleting old data...")
-        Order.objects.all().delete()
-        Customer.objects.all().delete()
-        Product.objects.all().delete()
-
-        self.stdout.write("Creating new data...")
-
-        # Create Customers
-        customers = [
-            Customer.objects.create(name='Alice', email='alice@example.com', phone='+1234567890'),
-            Customer.objects.create(name='Bob', email='bob@example.com', phone='123-456-7890'),
-            Customer.objects.create(name='Charlie', email='charlie@example.com'),
-        ]
-
-        # Create Products
-        products = [
-            Product.objects.create(name='Laptop', price=999.99, stock=10),
-            Product.objects.create(name='Mouse', price=25.50, stock=50),
-            Product.objects.create(name='Keyboard', price=75.00, stock=30),
-            Product.objects.create(name='Monitor', price=300.00, stock=15),
-        ]
-
-        # Create Orders
-        for customer in customers:
-            num_orders = random.randint(1, 3)
-            for _ in range(num_orders):
-                order = Order.objects.create(customer=customer)
-                num_products = random.randint(1, len(products))
-                random_products = random.sample(products, num_products)
-                order.products.set(random_products)
-                order.calculate_total_amount()
-
-        self.stdout.write(self.style.SUCCESS('Successfully seeded the database.'))
+    help = 'Seeds the database with initial data, or with a generated dataset of the given size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, help='Generate this many customers instead of the fixture')
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=0)
+        parser.add_argument('--seed', type=int, default=0, help='Seed for reproducible datasets')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--prefix', default='customer', help='Prefix of generated customer emails')
+        parser.add_argument(
+            '--as-of', type=datetime.fromisoformat,
+            help='Generate timestamps relative to this ISO date instead of now, for identical datasets across runs',
+        )
+        parser.add_argument('--append', action='store_true', help='Keep existing data instead of truncating it')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive.")
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            if not options['append']:
+                self.stdout.write("Deleting old data...")
+                truncate()
+
+            self.stdout.write("Creating new data...")
+            if options['customers'] is None:
+                seed_fixture(random.Random(options['seed']))
+            else:
+                lines = generate(
+                    options['customers'],
+                    options['products'],
+                    options['orders'],
+                    seed=options['seed'],
+                    batch_size=options['batch_size'],
+                    prefix=options['prefix'],
+                    now=as_of(options['as_of']),
+                )
+                self.stdout.write(
+                    f"Created {options['customers']} customers, {options['products']} products, "
+                    f"{options['orders']} orders and {lines} order lines."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully seeded the database in {time.perf_counter() - start:.1f}s.'
+        ))
@@ -0,0 +1,107 @@
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import connection
+from django.db.models import Manager, QuerySet
+
+
+class SyncResolverMiddleware:
+    """
+    Lets the async view execute the schema's synchronous resolvers.
+
+    Most resolvers only read attributes or loader caches, so each one first
+    runs on the event loop. Django refuses to touch the database there and
+    raises ``SynchronousOnlyOperation`` before any query is sent; only then
+    is the resolver retried through ``sync_to_async`` on the request's
+    thread, which the connection fields, the loaders and the async ORM all
+    share. Hopping threads for every field instead costs more than the
+    queries themselves.
+    """
+
+    def resolve(self, next, root, info, **args):
+        try:
+            result = next(root, info, **args)
+        except SynchronousOnlyOperation:
+            return sync_to_async(next)(root, info, **args)
+        if isinstance(result, (Manager, QuerySet)):
+            # Lazy results would otherwise be evaluated on the event loop.
+            return sync_to_async(list)(result.all())
+        return result
+
+
+class ProfilingMiddleware:
+    """
+    Records, per field path, how long resolvers ran and which SQL they sent,
+    and flags statements that ran more than once (usually an N+1).
+
+    SQL is captured from the current thread's default connection while the
+    profiler is entered, so wrap the execution with it::
+
+        with ProfilingMiddleware() as profiler:
+            result = schema.execute(query, middleware=[profiler])
+        profiler.report()
+    """
+
+    def __init__(self):
+        self.fields = defaultdict(lambda: {"calls": 0, "durationMs": 0.0, "sqlCount": 0, "sqlDurationMs": 0.0})
+        self.statements = defaultdict(lambda: {"count": 0, "paths": set()})
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.duration = 0.0
+        self._path = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        connection.execute_wrappers.append(self.record_query)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection.execute_wrappers.remove(self.record_query)
+        self.duration = time.perf_counter() - self._start
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sql_count += 1
+            self.sql_time += elapsed
+            statement = self.statements[sql]
+            statement["count"] += 1
+            if self._path is not None:
+                statement["paths"].add(self._path)
+                field = self.fields[self._path]
+                field["sqlCount"] += 1
+                field["sqlDurationMs"] += elapsed * 1000
+
+    def resolve(self, next, root, info, **args):
+        # List indices are dropped so every item of a list shares one entry.
+        path = ".".join(str(key) for key in info.path.as_list() if not isinstance(key, int))
+        parent, self._path = self._path, path
+        start = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+        finally:
+            self._path = parent
+            field = self.fields[path]
+            field["calls"] += 1
+            field["durationMs"] += (time.perf_counter() - start) * 1000
+        return result
+
+    def report(self):
+        return {
+            "durationMs": round(self.duration * 1000, 3),
+            "sql": {"count": self.sql_count, "durationMs": round(self.sql_time * 1000, 3)},
+            "fields": {
+                path: {key: round(value, 3) if isinstance(value, float) else value for key, value in field.items()}
+                for path, field in self.fields.items()
+            },
+            "duplicateQueries": [
+                {"sql": sql, "count": statement["count"], "paths": sorted(statement["paths"])}
+                for sql, statement in self.statements.items()
+                if statement["count"] > 1
+            ],
+        }
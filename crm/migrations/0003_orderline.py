@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def copy_order_products_to_lines(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    db = schema_editor.connection.alias
+    rows = Order.products.through.objects.using(db).select_related('product').order_by('pk')
+    batch = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        # The old table has no price history; the current price is the best snapshot.
+        batch.append(OrderLine(order_id=row.order_id, product_id=row.product_id, quantity=1, unit_price=row.product.price))
+        if len(batch) >= BATCH_SIZE:
+            OrderLine.objects.using(db).bulk_create(batch)
+            batch = []
+    OrderLine.objects.using(db).bulk_create(batch)
+
+
+def copy_lines_to_order_products(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderLine = apps.get_model('crm', 'OrderLine')
+    db = schema_editor.connection.alias
+    Through = Order.products.through
+    lines = OrderLine.objects.using(db).order_by('pk').values_list('order_id', 'product_id')
+    Through.objects.using(db).bulk_create(
+        (Through(order_id=order_id, product_id=product_id) for order_id, product_id in lines.iterator(chunk_size=BATCH_SIZE)),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_alter_customer_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='crm.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='unique_order_line_product')],
+            },
+        ),
+        migrations.RunPython(copy_order_products_to_lines, copy_lines_to_order_products),
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderLine', to='crm.product'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from crm.search import create_search_index, drop_search_index
+
+# The indexed columns as of this migration; later changes to
+# crm.search.SEARCH_FIELDS need a migration of their own.
+SEARCH_TABLES = {
+    "crm_customer": ("name", "email"),
+    "crm_product": ("name",),
+}
+
+
+def create_index(apps, schema_editor):
+    create_search_index(schema_editor.connection, SEARCH_TABLES)
+
+
+def drop_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection, SEARCH_TABLES)
+
+
+class Migration(migrations.Migration):
+    dependencies = [('crm', '0005_daily_stats')]
+    operations = [migrations.RunPython(create_index, drop_index)]
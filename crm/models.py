@@ -1,34 +1,271 @@
-from django.db import models
+import uuid
+from collections import Counter
+
+from django.db import connections, models, router, transaction
+from django.db.models import Case, F, Sum, Value, When
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .cache import invalidate
+
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone = PhoneNumberField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='crm_customer_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Insufficient stock for product ID: {', '.join(map(str, self.product_ids))}")
+
+class ProductManager(models.Manager):
+    def restock_low_stock(self, threshold, increment):
+        """
+        Adds ``increment`` to every product with stock below ``threshold`` and
+        returns the updated rows, using UPDATE ... RETURNING where supported.
+        """
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        # PostgreSQL and SQLite 3.35+ support UPDATE ... RETURNING. MariaDB
+        # only returns columns from INSERT, so the feature flag alone is not enough.
+        if connection.vendor not in ('postgresql', 'sqlite') or not connection.features.can_return_columns_from_insert:
+            return self._restock_low_stock_fallback(db, threshold, increment)
+
+        qn = connection.ops.quote_name
+        table = self.model._meta.db_table
+        fields = self.model._meta.concrete_fields
+        stock = qn(self.model._meta.get_field('stock').column)
+        sql = (
+            f"UPDATE {qn(table)} SET {stock} = {stock} + %s "
+            f"WHERE {stock} < %s RETURNING {', '.join(qn(f.column) for f in fields)}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [increment, threshold])
+            rows = cursor.fetchall()
+        invalidate(self.model)
+
+        # Raw rows skip the backend's converters, e.g. SQLite returns decimals as floats.
+        columns = [field.get_col(table) for field in fields]
+        converters = [
+            (i, column, connection.ops.get_db_converters(column) + column.get_db_converters(connection))
+            for i, column in enumerate(columns)
+        ]
+        attnames = [f.attname for f in fields]
+        products = []
+        for row in rows:
+            row = list(row)
+            for i, column, column_converters in converters:
+                for converter in column_converters:
+                    row[i] = converter(row[i], column, connection)
+            products.append(self.model.from_db(db, attnames, row))
+        return products
+
+    def _restock_low_stock_fallback(self, db, threshold, increment):
+        with transaction.atomic(using=db):
+            pks = list(
+                self.using(db).select_for_update().filter(stock__lt=threshold).values_list('pk', flat=True)
+            )
+            self.using(db).filter(pk__in=pks).update(stock=F('stock') + increment)
+            invalidate(self.model)
+            return list(self.using(db).filter(pk__in=pks))
+
+    def _locked(self, db, pks):
+        """
+        The products ``pks`` in primary key order, locked for update where the
+        backend has row locks. Orders sharing products then queue for them in
+        the same order and cannot deadlock. SQLite locks the whole database for
+        a write and needs no more.
+        """
+        products = self.using(db).filter(pk__in=pks).order_by('pk')
+        if connections[db].features.has_select_for_update:
+            products = products.select_for_update()
+        return products
+
+    def _take_stock(self, db, quantities):
+        # One UPDATE for every product, which only touches rows that still have enough.
+        quantity = Case(
+            *(When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()),
+            output_field=models.PositiveIntegerField(),
+        )
+        return self.using(db).filter(pk__in=quantities, stock__gte=quantity).update(stock=F('stock') - quantity)
+
+    def reserve_stock(self, quantities):
+        """
+        Takes ``{product_id: quantity}`` out of stock with a conditional
+        UPDATE ... WHERE stock >= quantity, so concurrent orders can never
+        sell more than there is. Raises InsufficientStock, leaving every
+        product untouched, when any of them has too little.
+        """
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            if connections[db].features.has_select_for_update:
+                list(self._locked(db, quantities).values_list('pk', flat=True))
+            if self._take_stock(db, quantities) < len(quantities):
+                stock = self.using(db).filter(pk__in=quantities).values_list('pk', 'stock')
+                raise InsufficientStock(pk for pk, available in stock if available < quantities[pk])
+            invalidate(self.model)
+
+    def allocate_stock(self, orders):
+        """
+        Reserves stock for each of ``orders`` (``{product_id: quantity}``
+        dicts) in turn, skipping those that can no longer be filled. Returns
+        ``{index: product ids short}`` for the skipped orders.
+        """
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            stock = dict(self._locked(db, {pk for quantities in orders for pk in quantities}).values_list('pk', 'stock'))
+            taken, short = Counter(), {}
+            for i, quantities in enumerate(orders):
+                missing = [pk for pk, qty in quantities.items() if stock.get(pk, 0) - taken[pk] < qty]
+                if missing:
+                    short[i] = missing
+                else:
+                    taken.update(quantities)
+            # The rows are locked, so this only fails if the products were deleted meanwhile.
+            if taken and self._take_stock(db, taken) < len(taken):
+                raise InsufficientStock(taken)
+            invalidate(self.model)
+        return short
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
     stock = models.PositiveIntegerField(default=0)
 
+    objects = ProductManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    products = models.ManyToManyField(Product, through='OrderLine', related_name='orders')
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date'], name='crm_order_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+            models.Index(fields=['customer', 'order_date'], name='crm_order_customer_date_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.customer.name}"
 
     def calculate_total_amount(self):
-        total = sum(product.price for product in self.products.all())
-        self.total_amount = total
-        self.save()
\ No newline at end of file
+        total = self.lines.aggregate(total=Sum(F('quantity') * F('unit_price')))['total']
+        self.total_amount = total or 0
+        self.save(update_fields=['total_amount'])
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_lines')
+    quantity = models.PositiveIntegerField(default=1)
+    # Price captured when the order was placed, so totals never depend on live prices.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_line_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} on order {self.order_id}"
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+class DailyStats(models.Model):
+    """
+    Per-day rollup of new customers, orders and revenue, maintained by
+    ``crm.rollups`` so reports never scan the ``Order`` table.
+    """
+    date = models.DateField(unique=True)
+    new_customers = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily stats'
+
+    def __str__(self):
+        return f"{self.date}: {self.orders} orders, {self.revenue} revenue"
+
+class RollupWatermark(models.Model):
+    # Highest primary key of ``name``'s table already folded into DailyStats.
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} up to {self.last_id}"
+
+class ImportJob(models.Model):
+    """
+    A customer import processed in the background by ``crm.tasks.import_customers``,
+    chunk by chunk. Counters and errors are updated in the same transaction
+    as each chunk's rows, so they always describe what was committed.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    CSV = 'csv'
+    NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (CSV, 'CSV'),
+        (NDJSON, 'NDJSON'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    source = models.CharField(max_length=255, help_text='Path of the uploaded rows in the default storage')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.id} ({self.status}, {self.processed_rows} rows)"
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 1.0 if self.status == self.SUCCEEDED else 0.0
+        return self.processed_rows / self.total_rows
+
+    @property
+    def rows_per_second(self):
+        if self.started_at is None:
+            return None
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return self.processed_rows / elapsed if elapsed > 0 else None
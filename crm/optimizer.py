@@ -0,0 +1,109 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def collect_fields(info, selection_set):
+    """
+    Flattens a selection set (including fragments) into a mapping of
+    snake_case field name to the list of field nodes selecting it.
+    """
+    fields = {}
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(to_snake_case(selection.name.value), []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            for name, nodes in collect_fields(info, selection.selection_set).items():
+                fields.setdefault(name, []).extend(nodes)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            for name, nodes in collect_fields(info, fragment.selection_set).items():
+                fields.setdefault(name, []).extend(nodes)
+    return fields
+
+
+def collect_subfields(info, nodes):
+    fields = {}
+    for node in nodes:
+        for name, subnodes in collect_fields(info, node.selection_set).items():
+            fields.setdefault(name, []).extend(subnodes)
+    return fields
+
+
+def connection_node_fields(info, nodes):
+    """
+    Returns the fields selected under ``edges { node { ... } }`` of a connection.
+    """
+    edges = collect_subfields(info, nodes).get("edges", [])
+    return collect_subfields(info, collect_subfields(info, edges).get("node", []))
+
+
+def node_fields(info, nodes):
+    """
+    Returns the fields selected on the objects of a relation, whether it is
+    exposed as a connection or as a plain list.
+    """
+    fields = collect_subfields(info, nodes)
+    if "edges" in fields:
+        return connection_node_fields(info, nodes)
+    return fields
+
+
+def model_columns(model, fields, prefix=""):
+    """
+    Returns the concrete columns backing the selected fields, including the
+    foreign key column of any selected forward relation.
+    """
+    columns = set()
+    for name in fields:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete and (not field.is_relation or field.many_to_one):
+            columns.add(prefix + field.attname)
+    return columns
+
+
+def optimize_queryset(queryset, info, required_fields=()):
+    """
+    Restricts a connection queryset to the columns and relations requested
+    by the current selection set, always keeping ``required_fields``.
+    """
+    fields = connection_node_fields(info, info.field_nodes)
+    if not fields:
+        return queryset
+
+    model = queryset.model
+    only = {model._meta.pk.attname} | model_columns(model, fields) | set(required_fields)
+    select_related = []
+    prefetch_related = []
+    for name, nodes in fields.items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.many_to_one:
+            related_fields = collect_subfields(info, nodes)
+            select_related.append(name)
+            only.add(f"{name}__{field.related_model._meta.pk.attname}")
+            only |= model_columns(field.related_model, related_fields, prefix=f"{name}__")
+        elif field.many_to_many or field.one_to_many:
+            related_model = field.related_model
+            related_fields = node_fields(info, nodes)
+            related_only = {related_model._meta.pk.attname} | model_columns(related_model, related_fields)
+            if field.one_to_many:
+                related_only.add(field.field.attname)
+            prefetch_related.append(
+                Prefetch(name, queryset=related_model._default_manager.only(*related_only))
+            )
+
+    queryset = queryset.only(*only)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
@@ -0,0 +1,68 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Replica that reads in the current context go to, if any.
+_replica = ContextVar("crm_replica", default=None)
+
+
+def replica_aliases():
+    """Aliases configured as replicas of the primary (``TEST["MIRROR"]``)."""
+    return [
+        alias for alias, database in settings.DATABASES.items()
+        if database.get("TEST", {}).get("MIRROR") == DEFAULT_DB_ALIAS
+    ]
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Sends the reads made inside the block to one replica, picked at random,
+    when any are configured. One replica serves the whole block so that it
+    reads one consistent state.
+    """
+    aliases = replica_aliases()
+    token = _replica.set(random.choice(aliases) if aliases else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def using_replica():
+    """Whether reads in the current context are sent to a replica."""
+    return _replica.get() is not None
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads inside ``read_from_replica()`` to its replica, and all
+    other reads and every write to the primary. Reads made while the
+    primary is inside a transaction stay on it, so they see the
+    transaction's own writes and locks.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replicating the primary.
+        if db in replica_aliases():
+            return False
+        return None
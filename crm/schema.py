@@ -1,50 +1,233 @@
 import graphene
 from graphene_django import DjangoObjectType
-from crm.models import Product, Customer, Order
+from collections import Counter
+
+from crm.models import Product, Customer, Order, OrderLine, DailyStats, ImportJob, InsufficientStock
 from django.core.exceptions import ValidationError
 from graphql import GraphQLError
 from django.db import transaction
 from phonenumber_field.phonenumber import to_python
-from graphene_django.filter import DjangoFilterConnectionField
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .cache import invalidate
+from .bulk import BATCH_SIZE, build_customers, existing_values
+from .imports import import_rows
+from .connections import APPROXIMATE, CRMConnection, KeysetConnectionField
+from .loaders import aload_object, cached_relation, get_loaders, load_object, parse_pk
+from .rollups import stats_between
+from .search import MAX_RESULTS, reindex, search
 
 # Types
 class CustomerType(DjangoObjectType):
     class Meta:
         model = Customer
-        fields = ("id", "name", "email", "phone", "created_at")
+        fields = ("id", "name", "email", "phone", "created_at", "orders")
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
+
+    @classmethod
+    def get_node(cls, info, id):
+        return load_object(info, Customer, id)
+
+    def resolve_orders(root, info, **kwargs):
+        orders = cached_relation(root, "orders")
+        if orders is None:
+            orders = get_loaders(info).orders_by_customer.load(root.pk)
+        return orders
 
 class ProductType(DjangoObjectType):
     class Meta:
         model = Product
-        fields = ("id", "name", "price", "stock")
+        fields = ("id", "name", "price", "stock", "orders")
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
+
+    @classmethod
+    def get_node(cls, info, id):
+        return load_object(info, Product, id)
+
+    def resolve_orders(root, info, **kwargs):
+        orders = cached_relation(root, "orders")
+        if orders is None:
+            orders = get_loaders(info).orders_by_product.load(root.pk)
+        return orders
+
+class OrderLineType(DjangoObjectType):
+    class Meta:
+        model = OrderLine
+        fields = ("product", "quantity", "unit_price")
+
+    def resolve_product(root, info):
+        product = cached_relation(root, "product")
+        if product is None:
+            product = get_loaders(info).product.load(root.product_id)
+        return product
 
 class OrderType(DjangoObjectType):
     class Meta:
         model = Order
-        fields = ("id", "customer", "products", "order_date", "total_amount")
+        fields = ("id", "customer", "products", "lines", "order_date", "total_amount")
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
+
+    @classmethod
+    def get_node(cls, info, id):
+        return load_object(info, Order, id)
+
+    def resolve_customer(root, info):
+        customer = cached_relation(root, "customer")
+        if customer is None:
+            customer = get_loaders(info).customer.load(root.customer_id)
+        return customer
+
+    def resolve_products(root, info, **kwargs):
+        products = cached_relation(root, "products")
+        if products is None:
+            products = [line.product for line in OrderType.resolve_lines(root, info)]
+        return products
+
+    def resolve_lines(root, info):
+        lines = cached_relation(root, "lines")
+        if lines is None:
+            lines = get_loaders(info).lines_by_order.load(root.pk)
+        return lines
+
+class BulkCustomerError(graphene.ObjectType):
+    # Also reports the rows of bulkCreateOrders and import jobs; the name is
+    # kept since clients select it in fragments.
+    index = graphene.Int()
+    field = graphene.String()
+    message = graphene.String()
+
+class ImportJobType(DjangoObjectType):
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id", "format", "status", "total_rows", "processed_rows", "created_rows", "failed_rows",
+            "message", "created_at", "started_at", "finished_at",
+        )
+
+    errors = graphene.List(BulkCustomerError, description="The first per-row errors, see failedRows for the count.")
+    progress = graphene.Float(description="Share of the rows processed, from 0 to 1.")
+    rows_per_second = graphene.Float()
+
+    def resolve_errors(root, info):
+        return [BulkCustomerError(**error) for error in root.errors]
+
+class DailyStatsType(DjangoObjectType):
+    class Meta:
+        model = DailyStats
+        fields = ("date", "new_customers", "orders", "revenue")
+
+class CRMStatsType(graphene.ObjectType):
+    # Lets the response cache evict crmStats when the rollups change.
+    cache_models = (DailyStats,)
+
+    customers = graphene.Int(description="New customers in the range.")
+    orders = graphene.Int()
+    revenue = graphene.Decimal()
+    days = graphene.List(DailyStatsType)
+
+class SearchResult(graphene.Union):
+    class Meta:
+        types = (CustomerType, ProductType)
+
+class SearchModel(graphene.Enum):
+    CUSTOMER = "customer"
+    PRODUCT = "product"
+
+SEARCH_MODELS = {SearchModel.CUSTOMER.value: Customer, SearchModel.PRODUCT.value: Product}
+
+def found_or_raise(model, instance):
+    if instance is None:
+        raise model.DoesNotExist(f"{model._meta.object_name} matching query does not exist.")
+    return instance
+
+def get_or_raise(info, model, pk):
+    return found_or_raise(model, load_object(info, model, pk))
+
+async def aget_or_raise(info, model, pk):
+    return found_or_raise(model, await aload_object(info, model, pk))
 
 # Queries
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType, filterset_class=CustomerFilter)
-    all_products = DjangoFilterConnectionField(ProductType, filterset_class=ProductFilter)
-    all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
+    all_customers = KeysetConnectionField(CustomerType, filterset_class=CustomerFilter)
+    all_products = KeysetConnectionField(ProductType, filterset_class=ProductFilter)
+    all_orders = KeysetConnectionField(
+        OrderType, filterset_class=OrderFilter, keyset=("order_date", "id"), count_mode=APPROXIMATE
+    )
     
     customer_by_id = graphene.Field(CustomerType, id=graphene.Int(required=True))
     product_by_id = graphene.Field(ProductType, id=graphene.Int(required=True))
     order_by_id = graphene.Field(OrderType, id=graphene.Int(required=True))
 
+    # Every lookup in the operation, aliases and node/nodes included, is
+    # loaded with one pk__in query per model.
     def resolve_customer_by_id(root, info, id):
-        return Customer.objects.get(pk=id)
+        return get_or_raise(info, Customer, id)
     
     def resolve_product_by_id(root, info, id):
-        return Product.objects.get(pk=id)
+        return get_or_raise(info, Product, id)
     
     def resolve_order_by_id(root, info, id):
-        return Order.objects.get(pk=id)
+        return get_or_raise(info, Order, id)
+
+    node = graphene.relay.Node.Field()
+    nodes = graphene.List(graphene.relay.Node, ids=graphene.List(graphene.NonNull(graphene.ID), required=True))
+
+    def resolve_nodes(root, info, ids):
+        return [graphene.relay.Node.get_node_from_global_id(info, global_id) for global_id in ids]
+
+    search = graphene.List(
+        graphene.NonNull(SearchResult),
+        term=graphene.String(required=True),
+        types=graphene.List(graphene.NonNull(SearchModel)),
+        first=graphene.Int(default_value=20),
+    )
+
+    def resolve_search(root, info, term, types=None, first=20):
+        if not 0 < first <= MAX_RESULTS:
+            raise GraphQLError(f"`first` must be between 1 and {MAX_RESULTS}.")
+        models = None if types is None else [SEARCH_MODELS[value.value] for value in types]
+        matches = search(term, models, first)
+        # The ranked keys are fetched with one query per model.
+        loaders = get_loaders(info)
+        for model, pk in matches:
+            loaders.for_model(model).prime([pk])
+        return [result for model, pk in matches if (result := loaders.for_model(model).load(pk)) is not None]
+
+    import_job = graphene.Field(ImportJobType, id=graphene.ID(required=True))
+
+    def resolve_import_job(root, info, id):
+        try:
+            return ImportJob.objects.get(pk=id)
+        except (ImportJob.DoesNotExist, ValidationError):
+            return None
+
+    crm_stats = graphene.Field(CRMStatsType, from_=graphene.Date(name="from"), to=graphene.Date())
+
+    def resolve_crm_stats(root, info, from_=None, to=None):
+        if from_ and to and from_ > to:
+            raise GraphQLError("`from` must not be after `to`.")
+        days, totals = stats_between(from_, to)
+        return CRMStatsType(days=days, **totals)
+
+
+class AsyncQuery(Query):
+    """
+    Query for the ASGI endpoint. The by-id lookups await the request's
+    loaders on the async ORM (``ain_bulk``), still one query per model for
+    every lookup of the operation. The other resolvers are inherited and run
+    through ``SyncResolverMiddleware``.
+    """
+
+    async def resolve_customer_by_id(root, info, id):
+        return await aget_or_raise(info, Customer, id)
+
+    async def resolve_product_by_id(root, info, id):
+        return await aget_or_raise(info, Product, id)
+
+    async def resolve_order_by_id(root, info, id):
+        return await aget_or_raise(info, Order, id)
 
 # Inputs
 class CustomerInput(graphene.InputObjectType):
@@ -81,47 +264,31 @@ class CreateCustomer(graphene.Mutation):
         
         return CreateCustomer(customer=customer, message="Customer created successfully.")
 
-class BulkCustomerError(graphene.ObjectType):
-    index = graphene.Int()
-    field = graphene.String()
-    message = graphene.String()
-
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(CustomerInput, required=True)
+        background = graphene.Boolean(
+            default_value=False,
+            description="Queue the rows as an import job instead of creating them in this request.",
+        )
 
     customers = graphene.List(CustomerType)
     errors = graphene.List(BulkCustomerError)
+    import_job = graphene.Field(ImportJobType)
 
     @staticmethod
-    def mutate(root, info, input):
-        created_customers = []
-        error_list = []
-        
+    def mutate(root, info, input, background=False):
+        if background:
+            return BulkCreateCustomers(customers=[], errors=[], import_job=import_rows(input))
+
+        customers, errors = build_customers(input)
+
         with transaction.atomic():
-            for i, customer_data in enumerate(input):
-                if Customer.objects.filter(email=customer_data.email).exists():
-                    error_list.append(BulkCustomerError(index=i, field="email", message=f"Email {customer_data.email} already exists."))
-                    continue
-                
-                phone_number = None
-                if customer_data.phone:
-                    try:
-                        phone_number = to_python(customer_data.phone)
-                        if not phone_number.is_valid():
-                            error_list.append(BulkCustomerError(index=i, field="phone", message="Invalid phone number."))
-                            continue
-                    except Exception:
-                        error_list.append(BulkCustomerError(index=i, field="phone", message="Invalid phone number format."))
-                        continue
-                
-                customer = Customer(name=customer_data.name, email=customer_data.email)
-                if phone_number:
-                    customer.phone = phone_number
-                customer.save()
-                created_customers.append(customer)
-        
-        return BulkCreateCustomers(customers=created_customers, errors=error_list)
+            created_customers = Customer.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+            reindex(Customer, [customer.pk for customer in created_customers])
+            invalidate(Customer)
+
+        return BulkCreateCustomers(customers=created_customers, errors=[BulkCustomerError(**error) for error in errors])
 
 class ProductInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -149,6 +316,19 @@ class OrderInput(graphene.InputObjectType):
     product_ids = graphene.List(graphene.ID, required=True)
     order_date = graphene.DateTime()
 
+def parse_product_ids(product_ids):
+    """
+    Returns each input product ID paired with its integer value (None when
+    it is not an integer), and the quantity of each product counted on those
+    values: a repeated ID becomes one line, and "1" and "01" are one product.
+    """
+    ids = [(str(pid), parse_pk(pid)) for pid in product_ids]
+    return ids, Counter(pk for _, pk in ids if pk is not None)
+
+def invalid_product_ids(ids, products):
+    """The input IDs, in order and once each, that are not in ``products``."""
+    return list(dict.fromkeys(raw for raw, pk in ids if pk not in products))
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
@@ -157,47 +337,126 @@ class CreateOrder(graphene.Mutation):
 
     @staticmethod
     def mutate(root, info, input):
+        customer_pk = parse_pk(input.customer_id)
         try:
-            customer = Customer.objects.get(pk=input.customer_id)
+            customer = Customer.objects.get(pk=customer_pk)
         except Customer.DoesNotExist:
             raise GraphQLError("Invalid customer ID.")
 
         if not input.product_ids:
             raise GraphQLError("At least one product must be selected.")
 
-        products = []
-        for pid in input.product_ids:
+        ids, quantities = parse_product_ids(input.product_ids)
+        products = Product.objects.in_bulk(list(quantities))
+        invalid_ids = invalid_product_ids(ids, products)
+        if invalid_ids:
+            raise GraphQLError(f"Invalid product ID: {', '.join(invalid_ids)}")
+
+        order = Order(customer=customer)
+        lines = [
+            OrderLine(order=order, product=products[pk], quantity=quantity, unit_price=products[pk].price)
+            for pk, quantity in quantities.items()
+        ]
+        order.total_amount = sum(line.line_total for line in lines)
+        with transaction.atomic():
+            # Stock is taken first, so a short order writes nothing else.
             try:
-                product = Product.objects.get(pk=pid)
-                products.append(product)
-            except Product.DoesNotExist:
-                raise GraphQLError(f"Invalid product ID: {pid}")
-
-        order = Order.objects.create(customer=customer)
-        order.products.set(products)
-        order.calculate_total_amount()
-        
+                Product.objects.reserve_stock(dict(quantities))
+            except InsufficientStock as e:
+                raise GraphQLError(str(e))
+            order.save()
+            OrderLine.objects.bulk_create(lines)
+            invalidate(OrderLine)
+
         return CreateOrder(order=order)
 
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(OrderInput), required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(BulkCustomerError)
+
+    @staticmethod
+    def mutate(root, info, input):
+        error_list = []
+        rows = [
+            (parse_pk(order_data.customer_id), *parse_product_ids(order_data.product_ids or []))
+            for order_data in input
+        ]
+        customer_ids = existing_values(Customer.objects, "pk", (cid for cid, _, _ in rows if cid is not None))
+        products = Product.objects.only("pk", "price").in_bulk(
+            list({pk for _, _, quantities in rows for pk in quantities})
+        )
+
+        orders = []
+        order_lines = []
+        indexes = []
+        for i, (customer_id, ids, quantities) in enumerate(rows):
+            if customer_id not in customer_ids:
+                error_list.append(BulkCustomerError(index=i, field="customerId", message="Invalid customer ID."))
+                continue
+            if not ids:
+                error_list.append(BulkCustomerError(index=i, field="productIds", message="At least one product must be selected."))
+                continue
+            invalid_ids = invalid_product_ids(ids, products)
+            if invalid_ids:
+                error_list.append(BulkCustomerError(index=i, field="productIds", message=f"Invalid product ID: {', '.join(invalid_ids)}"))
+                continue
+
+            lines = [
+                OrderLine(product_id=pk, quantity=quantity, unit_price=products[pk].price)
+                for pk, quantity in quantities.items()
+            ]
+            orders.append(Order(customer_id=customer_id, total_amount=sum(line.line_total for line in lines)))
+            order_lines.append(lines)
+            indexes.append(i)
+
+        with transaction.atomic():
+            # Orders are filled in input order while there is stock for them.
+            short = Product.objects.allocate_stock(
+                [{line.product_id: line.quantity for line in lines} for lines in order_lines]
+            )
+            for j, product_ids in short.items():
+                message = str(InsufficientStock(product_ids))
+                error_list.append(BulkCustomerError(index=indexes[j], field="productIds", message=message))
+            error_list.sort(key=lambda error: error.index)
+            orders = [order for j, order in enumerate(orders) if j not in short]
+            order_lines = [lines for j, lines in enumerate(order_lines) if j not in short]
+
+            Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+            for order, lines in zip(orders, order_lines):
+                for line in lines:
+                    line.order = order
+            OrderLine.objects.bulk_create(
+                (line for lines in order_lines for line in lines), batch_size=BATCH_SIZE
+            )
+            invalidate(Order, OrderLine)
+
+        return BulkCreateOrders(orders=orders, errors=error_list)
+
 class UpdateLowStockProducts(graphene.Mutation):
+    class Arguments:
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
+
     updated_products = graphene.List(ProductType)
     message = graphene.String()
 
     @staticmethod
-    def mutate(root, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_count = low_stock_products.count()
+    def mutate(root, info, threshold, increment):
+        if increment <= 0:
+            raise GraphQLError("Increment must be positive.")
 
-        for product in low_stock_products:
-            product.stock += 10
-            product.save()
-        
-        message = f"Successfully restocked {updated_count} products."
-        return UpdateLowStockProducts(updated_products=low_stock_products, message=message)
+        updated_products = Product.objects.restock_low_stock(threshold, increment)
+
+        message = f"Successfully restocked {len(updated_products)} products."
+        return UpdateLowStockProducts(updated_products=updated_products, message=message)
 
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
@@ -0,0 +1,234 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .bulk import chunked
+from .models import Customer, Product
+
+# Indexed columns per model, most important first: a match on the first
+# column ranks above a match on the others.
+SEARCH_FIELDS = {
+    Customer: ("name", "email"),
+    Product: ("name",),
+}
+
+MAX_RESULTS = 100
+# Matches ranked per query and tier. Terms matching more rows than this rank
+# the first RANK_WINDOW of them rather than every row, which keeps a search
+# for a very common word as cheap as for a rare one.
+RANK_WINDOW = 1000
+
+
+def index_table(table):
+    return f"{table}_search"
+
+
+def search_words(term):
+    # Letters and digits only, so words can be quoted into either query syntax.
+    return re.findall(r"[^\W_]+", term.lower())
+
+
+class SQLiteSearchIndex:
+    """
+    One FTS5 table per model whose rowid is the model's primary key. The
+    unicode61 tokenizer splits emails at "@" and "." so their parts match,
+    and prefix indexes serve the last, partly typed word of two to four
+    characters without merging every term it starts.
+    """
+
+    def create(self, cursor, table, fields):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {index_table(table)} "
+            f"USING fts5({', '.join(fields)}, tokenize='unicode61', prefix='2 3 4')"
+        )
+
+    def drop(self, cursor, table):
+        cursor.execute(f"DROP TABLE IF EXISTS {index_table(table)}")
+
+    def delete(self, cursor, table, pks):
+        if pks is None:
+            cursor.execute(f"DELETE FROM {index_table(table)}")
+        else:
+            cursor.execute(f"DELETE FROM {index_table(table)} WHERE rowid IN ({', '.join(['%s'] * len(pks))})", pks)
+
+    def insert(self, cursor, table, fields, pks):
+        sql = (
+            f"INSERT INTO {index_table(table)} (rowid, {', '.join(fields)}) "
+            f"SELECT id, {', '.join(fields)} FROM {table}"
+        )
+        if pks is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(f"{sql} WHERE id IN ({', '.join(['%s'] * len(pks))})", pks)
+
+    def match(self, words):
+        *complete, last = words
+        return " ".join([*(f'"{word}"' for word in complete), f'"{last}"*' if len(last) > 1 else f'"{last}"'])
+
+    def query(self, table, fields, words):
+        table, title = index_table(table), fields[0]
+        match = self.match(words)
+        sql = (
+            f"SELECT rowid, MIN(tier) * 1000 + MIN(LENGTH({title})) AS score FROM ("
+            f"SELECT * FROM (SELECT rowid, 0 AS tier, {title} FROM {table} WHERE {table} MATCH %s LIMIT {RANK_WINDOW}) "
+            f"UNION ALL "
+            f"SELECT * FROM (SELECT rowid, 1 AS tier, {title} FROM {table} WHERE {table} MATCH %s LIMIT {RANK_WINDOW})"
+            f") GROUP BY rowid"
+        )
+        return sql, [f"{{{title}}}: ({match})", match]
+
+
+class PostgreSQLSearchIndex:
+    """
+    One table per model holding a weighted ``tsvector`` per row behind a GIN
+    index. The "simple" configuration neither stems nor drops stop words,
+    which suits names and emails.
+    """
+
+    def document(self, fields):
+        # Punctuation is turned into spaces so emails split like they do on SQLite.
+        return " || ".join(
+            f"setweight(to_tsvector('simple', translate(coalesce({field}, ''), '@._-', '    ')), "
+            f"'{'A' if i == 0 else 'B'}')"
+            for i, field in enumerate(fields)
+        )
+
+    def create(self, cursor, table, fields):
+        table = index_table(table)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (object_id bigint PRIMARY KEY, document tsvector NOT NULL)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_document ON {table} USING gin (document)")
+
+    def drop(self, cursor, table):
+        cursor.execute(f"DROP TABLE IF EXISTS {index_table(table)}")
+
+    def delete(self, cursor, table, pks):
+        if pks is None:
+            cursor.execute(f"TRUNCATE {index_table(table)}")
+        else:
+            cursor.execute(f"DELETE FROM {index_table(table)} WHERE object_id = ANY(%s)", [pks])
+
+    def insert(self, cursor, table, fields, pks):
+        sql = (
+            f"INSERT INTO {index_table(table)} (object_id, document) "
+            f"SELECT id, {self.document(fields)} FROM {table}"
+        )
+        if pks is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(f"{sql} WHERE id = ANY(%s)", [pks])
+
+    def match(self, words, weight=""):
+        *complete, last = words
+        prefix = "*" if len(last) > 1 else ""
+        lexemes = [f"{word}:{weight}" if weight else word for word in complete]
+        lexemes.append(f"{last}:{prefix}{weight}" if prefix or weight else last)
+        return " & ".join(lexemes)
+
+    def query(self, table, fields, words):
+        table = index_table(table)
+        # LENGTH() of a tsvector is its number of lexemes.
+        sql = (
+            f"SELECT object_id, MIN(tier) * 1000 + MIN(LENGTH(document)) AS score FROM ("
+            f"(SELECT object_id, 0 AS tier, document FROM {table} "
+            f"WHERE document @@ to_tsquery('simple', %s) LIMIT {RANK_WINDOW}) "
+            f"UNION ALL "
+            f"(SELECT object_id, 1 AS tier, document FROM {table} "
+            f"WHERE document @@ to_tsquery('simple', %s) LIMIT {RANK_WINDOW})"
+            f") matches GROUP BY object_id"
+        )
+        return sql, [self.match(words, "A"), self.match(words)]
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteSearchIndex(),
+    "postgresql": PostgreSQLSearchIndex(),
+}
+
+
+def search_backend(connection):
+    return SEARCH_BACKENDS.get(connection.vendor)
+
+
+def create_search_index(connection, tables):
+    """
+    Creates and fills the index of each ``{table: columns}`` entry. Takes
+    tables rather than models so migrations can pass the columns as they
+    were at that migration.
+    """
+    backend = search_backend(connection)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        for table, fields in tables.items():
+            backend.create(cursor, table, fields)
+            backend.insert(cursor, table, fields, None)
+
+
+def drop_search_index(connection, tables):
+    backend = search_backend(connection)
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        for table in tables:
+            backend.drop(cursor, table)
+
+
+def reindex(model, pks=None):
+    """
+    Copies the current rows of ``model`` into its search index, removing the
+    rows that no longer exist. ``pks=None`` rebuilds the whole index.
+    """
+    connection = connections[router.db_for_write(model)]
+    backend = search_backend(connection)
+    if backend is None:
+        return
+    table, fields = model._meta.db_table, SEARCH_FIELDS[model]
+    with connection.cursor() as cursor:
+        if pks is None:
+            backend.delete(cursor, table, None)
+            backend.insert(cursor, table, fields, None)
+            return
+        for chunk in chunked(pks):
+            backend.delete(cursor, table, chunk)
+            backend.insert(cursor, table, fields, chunk)
+
+
+def search(term, models=None, limit=20):
+    """
+    Returns ``(model, pk)`` pairs for the best ``limit`` rows matching every
+    word of ``term``, the last one as a prefix since it may still be typed.
+    Matches in the first indexed column (the name) rank first, then shorter
+    and so closer names.
+    """
+    words = search_words(term)
+    if not words or limit <= 0:
+        return []
+    models = [model for model in SEARCH_FIELDS if models is None or model in models]
+    if not models:
+        return []
+    connection = connections[router.db_for_read(Customer)]
+    backend = search_backend(connection)
+    if backend is None:
+        return fallback_search(words, models, limit)
+
+    # Each model's top matches are merged by score in one round trip.
+    parts, params = [], []
+    for i, model in enumerate(models):
+        sql, part_params = backend.query(model._meta.db_table, SEARCH_FIELDS[model], words)
+        parts.append(f"SELECT {i} AS kind, ranked.* FROM ({sql}) ranked")
+        params.extend(part_params)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{' UNION ALL '.join(parts)} ORDER BY score LIMIT %s", [*params, limit])
+        return [(models[kind], pk) for kind, pk, _ in cursor.fetchall()]
+
+
+def fallback_search(words, models, limit):
+    """Unranked ``icontains`` matching for backends without a search index."""
+    results = []
+    for model in models:
+        condition = Q()
+        for word in words:
+            condition &= Q.create([(f"{field}__icontains", word) for field in SEARCH_FIELDS[model]], connector=Q.OR)
+        results.extend((model, pk) for pk in model.objects.filter(condition).values_list("pk", flat=True)[:limit])
+    return results[:limit]
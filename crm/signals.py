@@ -0,0 +1,97 @@
+from collections import defaultdict
+from threading import local
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Customer, Product, Order, OrderLine, ImportJob
+from .search import SEARCH_FIELDS, reindex
+from .tasks import refresh_daily_stats
+
+# Order lines change what an order's products are, so they also evict Order reads.
+AFFECTED_MODELS = {
+    Customer: (Customer,),
+    Product: (Product,),
+    Order: (Order,),
+    OrderLine: (OrderLine, Order),
+    ImportJob: (ImportJob,),
+}
+
+
+def invalidate_model_responses(sender, **kwargs):
+    invalidate(*AFFECTED_MODELS[sender])
+
+
+# Connected per model: a delete receiver without a sender would turn off
+# Django's fast-delete path for every model in the project.
+for model in AFFECTED_MODELS:
+    post_save.connect(invalidate_model_responses, sender=model)
+    post_delete.connect(invalidate_model_responses, sender=model)
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_products(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate(*AFFECTED_MODELS[OrderLine])
+
+
+# Seconds new rows wait for the rollup refresh, which folds in every row
+# created in that window with one run.
+ROLLUP_REFRESH_DELAY = 5
+ROLLUP_REFRESH_KEY = "crm:rollup-refresh-queued"
+
+
+def queue_rollup_refresh():
+    # The key expires before the task runs, so a row committed after that
+    # queues the next refresh rather than being skipped by this one.
+    if cache.add(ROLLUP_REFRESH_KEY, True, ROLLUP_REFRESH_DELAY):
+        refresh_daily_stats.apply_async(countdown=ROLLUP_REFRESH_DELAY + 1)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Order)
+def refresh_rollups(sender, created, **kwargs):
+    # The refresh runs on a worker, not in the request. Rows written with
+    # bulk_create, or whose refresh failed to queue, are folded in by the
+    # periodic refresh_daily_stats task.
+    if created:
+        transaction.on_commit(queue_rollup_refresh, robust=True)
+
+
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    # Writes made with bulk_create or update() are reindexed by their callers.
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS[sender]):
+        return
+    reindex(sender, [instance.pk])
+
+
+# Primary keys of deleted rows still in the search index, per model.
+_deleted = local()
+
+
+def queue_search_removal(sender, instance, **kwargs):
+    # A queryset delete sends this for every row, so the rows leave the index
+    # together once the delete commits rather than with two statements each.
+    # Search drops results whose row is gone, so the index may briefly lag.
+    pending = getattr(_deleted, "pks", None)
+    if pending is None:
+        pending = _deleted.pks = defaultdict(set)
+    pending[sender].add(instance.pk)
+    transaction.on_commit(remove_deleted_from_search_index, robust=True)
+
+
+def remove_deleted_from_search_index():
+    # Registered once per deleted row; the first call after the commit does the work.
+    pending, _deleted.pks = getattr(_deleted, "pks", None), None
+    for model, pks in (pending or {}).items():
+        # Rows queued by a delete that rolled back still exist and are
+        # simply reindexed as they are.
+        reindex(model, sorted(pks))
+
+
+for model in SEARCH_FIELDS:
+    post_save.connect(update_search_index, sender=model)
+    post_delete.connect(queue_search_removal, sender=model)
@@ -1,28 +1,57 @@
 import requests
-from datetime import datetime
+from datetime import timedelta
 from celery import shared_task
-from django.db.models import Sum, Count
-from crm.models import Customer, Order
+from django.utils import timezone
+from crm import imports, rollups
 
 LOG_FILE = "/tmp/crm_report_log.txt"
 
+@shared_task
+def refresh_daily_stats():
+    """
+    Catch-up task that folds customers and orders created since the last
+    run into the DailyStats rollup, including bulk inserts that bypass the
+    post_save hook.
+    """
+    return rollups.refresh_daily_stats()
+
+
+@shared_task
+def rebuild_recent_daily_stats(days=2):
+    """
+    Recomputes the last ``days`` of rollups from the source tables so
+    deleted orders and late commits are reflected.
+    """
+    today = timezone.localdate()
+    return rollups.rebuild_daily_stats(today - timedelta(days=days - 1), today)
+
+
+@shared_task(acks_late=True)
+def import_customers(job_id):
+    """
+    Runs a queued customer import. Acknowledged only once it returns, so a
+    job whose worker died is delivered again and resumes after its last
+    committed chunk.
+    """
+    return imports.run_import(job_id).status
+
+
 @shared_task
 def generate_crm_report():
     """
     A Celery task that generates a weekly CRM report, calculating total
-    customers, orders, and revenue using the Django ORM.
+    customers, orders, and revenue from the DailyStats rollup.
     """
-    # Use the ORM to get aggregate data efficiently.
-    customer_count = Customer.objects.count()
-    order_count = Order.objects.count()
-    
-    # Use aggregate to calculate the sum of 'total_amount' across all orders.
-    # The result is a dictionary, e.g., {'total_revenue': Decimal('123.45')}
-    revenue_data = Order.objects.aggregate(total_revenue=Sum('total_amount'))
-    total_revenue = revenue_data['total_revenue'] or 0 # Handle case with no orders.
+    # Fold in anything created since the last catch-up, then read the
+    # rollup rows instead of scanning Customer and Order.
+    rollups.refresh_daily_stats()
+    _, totals = rollups.stats_between()
+    customer_count = totals["customers"]
+    order_count = totals["orders"]
+    total_revenue = totals["revenue"]
 
     # Format the report line
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    timestamp = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
     report_line = (
         f"{timestamp} - Report: {customer_count} customers, {order_count} orders, "
         f"${total_revenue:.2f} revenue\n"
@@ -1,3 +1,476 @@
-from django.shortcuts import render
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from contextlib import nullcontext
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.core.files import File
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.http.response import HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, parse, validate_schema
+from graphql.error import GraphQLError
+from graphql.validation import validate
+
+from .cache import DocumentCache, response_cache
+from .complexity import query_cost_rule
+from .imports import CONTENT_TYPES, LimitedReader, UploadTooLarge, create_import, import_options
+from .middleware import ProfilingMiddleware, SyncResolverMiddleware
+from .routers import read_from_replica, using_replica
+
+PERSISTED_QUERY_PREFIX = "crm:persisted-query:"
+
+DEFAULT_PERSISTED_QUERIES = {
+    # Seconds a registered query is kept; clients register it again when
+    # told PersistedQueryNotFound.
+    "TIMEOUT": 24 * 60 * 60,
+}
+
+DEFAULT_PROFILE = {
+    "HEADER": "X-GraphQL-Profile",
+    # Profile a SAMPLE_RATE fraction of operations and log them to
+    # "crm.profile", header or not. Profiled operations skip the response
+    # cache, run synchronously and read from the primary.
+    "LOG": False,
+    "SAMPLE_RATE": 0.01,
+}
+
+logger = logging.getLogger("crm.profile")
+
+
+def profile_options():
+    return {**DEFAULT_PROFILE, **getattr(settings, "GRAPHQL_PROFILE", {})}
+
+
+def persisted_query_options():
+    return {**DEFAULT_PERSISTED_QUERIES, **getattr(settings, "GRAPHQL_PERSISTED_QUERIES", {})}
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PreparedOperation:
+    """
+    A parsed, validated operation, the cost extensions to report with it and,
+    when the request asked for one, its profiler.
+    """
+
+    def __init__(self, schema, document_key, document, operation_ast, variables, operation_name, extensions,
+                 profiler=None, expose_profile=False):
+        self.schema = schema
+        self.document_key = document_key
+        self.document = document
+        self.operation_ast = operation_ast
+        self.variables = variables
+        self.operation_name = operation_name
+        self.extensions = extensions
+        self.profiler = profiler
+        self.expose_profile = expose_profile
+
+    @property
+    def is_query(self):
+        return self.operation_ast is not None and self.operation_ast.operation == OperationType.QUERY
+
+    def cache_key(self):
+        return response_cache.key(self.document_key, self.schema, self.document, self.variables, self.operation_name)
+
+    def cacheable(self, from_replica):
+        # A lagging replica can answer with the state before a write whose
+        # new versions are already in the key, so such answers are not kept.
+        return not from_replica or not response_cache.recently_written(self.document_key, self.schema, self.document)
+
+    def finish(self, result):
+        result.extensions = {**(result.extensions or {}), **self.extensions}
+        if self.profiler is not None:
+            start = time.perf_counter()
+            json.dumps(result.data)
+            report = {
+                "operationName": self.operation_name,
+                **self.profiler.report(),
+                "serializationMs": round((time.perf_counter() - start) * 1000, 3),
+            }
+            if profile_options()["LOG"]:
+                logger.info("graphql profile %s", json.dumps(report), extra={"graphql_profile": report})
+            if self.expose_profile:
+                result.extensions["profile"] = report
+        return result
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that supports automatic persisted queries (a SHA-256 hash in
+    ``extensions.persistedQuery`` instead of the query text) and reuses
+    parsed, validated documents across requests for identical operations.
+    Operations are rejected before execution when their estimated cost or
+    depth is over budget, and the estimate is returned in ``extensions.cost``.
+    Queries read from a database replica when any are configured.
+    """
+
+    document_cache = DocumentCache(getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 512))
+
+    @staticmethod
+    def get_persisted_query(request, data):
+        extensions = data.get("extensions") or request.GET.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        persisted_query = (extensions or {}).get("persistedQuery")
+        if persisted_query is not None and not (
+            isinstance(persisted_query, dict) and isinstance(persisted_query.get("sha256Hash"), str)
+        ):
+            raise HttpError(HttpResponseBadRequest("persistedQuery.sha256Hash is required."))
+        return persisted_query
+
+    def get_document(self, query, persisted_query):
+        """
+        Returns ``(key, document, validation_errors)`` for the operation,
+        parsing and validating it only the first time its hash is seen.
+        """
+        if persisted_query is None:
+            key = query_hash(query)
+        else:
+            key = persisted_query["sha256Hash"]
+            if query:
+                if query_hash(query) != key:
+                    raise GraphQLError("provided sha does not match query")
+                cache.set(PERSISTED_QUERY_PREFIX + key, query, persisted_query_options()["TIMEOUT"])
+
+        entry = self.document_cache.get(key)
+        if entry is not None:
+            return (key, *entry)
+
+        if not query:
+            query = cache.get(PERSISTED_QUERY_PREFIX + key)
+            if query is None:
+                raise GraphQLError("PersistedQueryNotFound")
+
+        document = parse(query)
+        errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        self.document_cache.set(key, (document, errors))
+        return key, document, errors
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """
+        Parses and validates the request's operation. Returns a
+        ``PreparedOperation`` ready to execute, or the ``ExecutionResult``
+        (``None`` for GraphiQL) to respond with instead.
+        """
+        persisted_query = self.get_persisted_query(request, data)
+        if not query and persisted_query is None:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document_key, document, validation_errors = self.get_document(query, persisted_query)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        costs = {}
+        cost_errors = validate(
+            schema,
+            document,
+            [query_cost_rule(variables, lambda name, cost, depth: costs.setdefault(name, (cost, depth)))],
+        )
+        selected = operation_ast.name.value if operation_ast and operation_ast.name else None
+        cost, depth = costs.get(selected, (None, None))
+        extensions = {"cost": {"estimated": cost, "depth": depth}}
+        if cost_errors:
+            return ExecutionResult(errors=cost_errors, extensions=extensions)
+
+        expose_profile = self.wants_profile(request)
+        profiler = ProfilingMiddleware() if expose_profile or self.samples_profile() else None
+        return PreparedOperation(
+            schema, document_key, document, operation_ast, variables, operation_name, extensions,
+            profiler, expose_profile,
+        )
+
+    @staticmethod
+    def samples_profile():
+        options = profile_options()
+        return options["LOG"] and random.random() < options["SAMPLE_RATE"]
+
+    @staticmethod
+    def wants_profile(request):
+        header = request.headers.get(profile_options()["HEADER"], "")
+        allowed = settings.DEBUG or getattr(getattr(request, "user", None), "is_staff", False)
+        return allowed and header.lower() in ("1", "true")
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        prepared = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if not isinstance(prepared, PreparedOperation):
+            return prepared
+        return prepared.finish(self.run_operation(request, prepared))
+
+    @staticmethod
+    def database_for(prepared):
+        # Queries read from a replica. Mutations use the primary, and so do
+        # profiled operations, whose SQL is captured on its connection.
+        if prepared.is_query and prepared.profiler is None:
+            return read_from_replica()
+        return nullcontext()
+
+    def run_operation(self, request, prepared):
+        with self.database_for(prepared):
+            if prepared.profiler is None:
+                return self.execute_operation(request, prepared)
+            with prepared.profiler:
+                return self.execute_operation(request, prepared)
+
+    def get_execute_options(self, request, prepared):
+        middleware = self.get_middleware(request)
+        if prepared.profiler is not None:
+            middleware = [*(middleware or []), prepared.profiler]
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": prepared.variables,
+            "operation_name": prepared.operation_name,
+            "middleware": middleware,
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_operation(self, request, prepared):
+        schema, document, operation_ast = prepared.schema, prepared.document, prepared.operation_ast
+        try:
+            execute_options = self.get_execute_options(request, prepared)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            # Profiled requests skip the response cache, they are after the real work.
+            if prepared.is_query and response_cache.enabled and prepared.profiler is None:
+                cache_key = prepared.cache_key()
+                data = response_cache.get(cache_key)
+                if data is not None:
+                    return ExecutionResult(data=data)
+                result = execute(schema, document, **execute_options)
+                if not result.errors and prepared.cacheable(using_replica()):
+                    response_cache.set(cache_key, result.data)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        # Same as the tail of GraphQLView.get_response, but also returns result extensions.
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [
+                    self.format_error(e) for e in execution_result.errors
+                ]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI deployments. Queries execute on the event loop so
+    ``async def`` resolvers await I/O without holding a thread. Synchronous
+    resolvers that may touch the database, such as the connection fields and
+    loaders, run through ``sync_to_async`` on the request's thread. Mutations
+    run synchronously as a whole so ``ATOMIC_MUTATIONS`` keeps working, and
+    so do profiled operations so that their SQL is captured on one connection.
+    """
+
+    view_is_async = True
+
+    @staticmethod
+    def runs_synchronously(prepared):
+        return not prepared.is_query or prepared.profiler is not None
+
+    def get_execute_options(self, request, prepared):
+        execute_options = super().get_execute_options(request, prepared)
+        if not self.runs_synchronously(prepared):
+            execute_options["middleware"] = [SyncResolverMiddleware(), *(execute_options["middleware"] or [])]
+        return execute_options
+
+    @method_decorator(ensure_csrf_cookie)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                # GraphiQL is static, so the synchronous view renders it.
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = await asyncio.gather(*(self.aget_response(request, entry) for entry in data))
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = responses and max(response[1] for response in responses) or 200
+            else:
+                result, status_code = await self.aget_response(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        prepared = await sync_to_async(self.prepare_operation)(request, data, query, variables, operation_name)
+        if isinstance(prepared, PreparedOperation):
+            execution_result = prepared.finish(await self.aexecute_operation(request, prepared))
+        else:
+            execution_result = prepared
+        return self.format_response(request, execution_result, id)
+
+    async def aexecute_operation(self, request, prepared):
+        if self.runs_synchronously(prepared):
+            return await sync_to_async(self.run_operation)(request, prepared)
+
+        cache_key = None
+        if response_cache.enabled:
+            cache_key = await sync_to_async(prepared.cache_key)()
+            data = await sync_to_async(response_cache.get)(cache_key)
+            if data is not None:
+                return ExecutionResult(data=data)
+
+        try:
+            with self.database_for(prepared):
+                from_replica = using_replica()
+                result = execute(prepared.schema, prepared.document, **self.get_execute_options(request, prepared))
+                if isawaitable(result):
+                    result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        if cache_key is not None and not result.errors and await sync_to_async(prepared.cacheable)(from_replica):
+            await sync_to_async(response_cache.set)(cache_key, result.data)
+        return result
+
+
+class CustomerImportView(View):
+    """
+    Queues a customer import from a CSV (``text/csv``, with a header row) or
+    NDJSON (``application/x-ndjson``) request body, and answers 202 with the
+    job's id for the ``importJob`` query. The body is copied to storage as
+    it is read, so it is never held in memory, up to
+    ``CUSTOMER_IMPORT["MAX_UPLOAD_SIZE"]`` bytes; larger uploads get a 413.
+    """
+
+    def post(self, request):
+        format = CONTENT_TYPES.get(request.content_type)
+        if format is None:
+            return JsonResponse(
+                {"error": f"Send the rows as one of: {', '.join(sorted(CONTENT_TYPES))}."}, status=415
+            )
+        limit = import_options()["MAX_UPLOAD_SIZE"]
+        too_large = JsonResponse({"error": f"Uploads are limited to {limit} bytes."}, status=413)
+        # Content-Length rejects most uploads up front; the reader catches
+        # bodies sent without one, or longer than announced.
+        if int(request.META.get("CONTENT_LENGTH") or 0) > limit:
+            return too_large
+        try:
+            job = create_import(File(LimitedReader(request, limit)), format)
+        except UploadTooLarge:
+            return too_large
+        return JsonResponse({"id": str(job.pk), "status": job.status}, status=202)